@@ -6,48 +6,42 @@
 # Main entry point for the drought-swa-yield_anom project.
 # --------------------------------------------------------------
 import argparse
-from src.config import Config
+import importlib
+import logging
+import re
+import shutil
 import sys
-from argparse import ArgumentParser
 import shlex
+from functools import lru_cache
+from itertools import takewhile
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Main entry point for drought-swa-yield_anom project."
-    )
-    subparsers = parser.add_subparsers(dest="module", help="Choose the analysis module to run")
+logger = logging.getLogger(__name__)
 
-    # General information
-    parser.add_argument("--version", "-v", action="version", version="drought-swa-yield_anom 1.0", help="Show program version and exit")
-    parser.add_argument("--about", "--description", "-a", action="store_true", help="Show information about the program and exit")
-    parser.add_argument("--authors", action="store_true", help="Show authors of the program and exit")
-    parser.add_argument("--title", action="store_true", help="Show the program title and exit")
+VERSION = "drought-swa-yield_anom 1.0"
 
-    # Config options
-    parser_config = parser.add_argument_group("Configuration options")
-    parser_config.add_argument("--th_detection_drought", "--threshold", "-th", type=float, default=Config().th_detection_drought, help="Threshold for drought detection")
-    parser_config.add_argument("--start_year", type=int, default=Config().start_year, help="Start year")
-    parser_config.add_argument("--end_year", type=int, default=Config().end_year, help="End year")
-    parser_config.add_argument("--month_start", type=int, default=Config().month_start, help="Start month")
-    parser_config.add_argument("--month_end", type=int, default=Config().month_end, help="End month")    
-    parser_config.add_argument("--regions", nargs="+", default=["all"], help="Regions to process", choices=["europe", "usa", "china", "india", "canada", "argentina", "brazil", "all"], type=str)
-    parser_config.add_argument("--TH_SWA", "--th_swa", type=float, default=Config().TH_SWA, help="Threshold for SWA analysis")
-    parser_config.add_argument("--TH_YA", "--th_ya", type=float, default=Config().TH_YA, help="Threshold for Yield analysis")
-    parser_config.add_argument("--TH_SWA_LIST", "--th_swa_list", nargs="+", type=float, default=Config().TH_SWA_list, help="List of thresholds for SWA analysis")
-    parser_config.add_argument("--TH_YA_LIST", "--th_ya_list", nargs="+", type=float, default=Config().TH_YA_list, help="List of thresholds for Yield analysis")
+# Regions accepted by the --regions options, shared by all the parsers
+_REGIONS = ("europe", "usa", "china", "india", "canada", "argentina", "brazil", "all")
 
+# Option strings of the general information flags
+INFO_OPTIONS = {
+    "version": ("--version", "-v"),
+    "about": ("--about", "--description", "-a"),
+    "authors": ("--authors",),
+    "title": ("--title",),
+    "interactive": ("--interactive", "-i"),
+}
 
 
-    
-    ##### Yield analysis
-    parser_yield = subparsers.add_parser("yield", help="Yield analysis")
-
+def add_yield_arguments(parser_yield, cfg):
+    """Add the options of the yield analysis module to its subparser."""
     ## General options
     parser_yield.add_argument("--run", "--run_all", help="Run all steps: standardization, processing, visualization", action="store_true")
+    parser_yield.add_argument("-q", "--quiet", help="Hide the progress messages", action="store_true")
+    parser_yield.add_argument("-j", "--jobs", type=int, default=1, help="Number of regions processed in parallel processes (default: 1, one region after the other)")
     ## Configuration options
-    parser_yield.add_argument("-r", "--regions", nargs="+", default="all", help="Regions to standardize", choices=["europe", "usa", "china", "india", "canada", "argentina", "brazil", "all"], type=str)
-    parser_yield.add_argument("--start_year", type=int, default=Config().start_year, help="Start year for analysis (default: 1991)")
-    parser_yield.add_argument("--end_year", type=int, default=Config().end_year, help="End year for analysis (default: 2023)")
+    parser_yield.add_argument("-r", "--regions", nargs="+", default="all", help="Regions to standardize", choices=_REGIONS, type=str.lower)
+    parser_yield.add_argument("--year_start", "--start_year", type=int, default=cfg.year_start, help="Start year for analysis (default: 1991)")
+    parser_yield.add_argument("--year_end", "--end_year", type=int, default=cfg.year_end, help="End year for analysis (default: 2023)")
 
     ## Standardization options
     yield_group_std = parser_yield.add_argument_group("Standardization options")
@@ -71,22 +65,18 @@ def main():
     yield_group_vis.add_argument("--save_plot", help="Save plots after computation", action="store_true")
     yield_group_vis.add_argument("--anomaly_type", type=str, default="normalized", choices=["standardized", "normalized"], help="Type of anomaly series to plot")
     yield_group_vis.add_argument("--anomaly_map", type=str, default="neg", choices=["neg", "pos"], help="Type of anomaly map to plot. 'neg' for negative anomalies, 'pos' for positive anomalies")
-    
-
 
 
-
-    ##### SWA analysis
-    parser_swa = subparsers.add_parser("swa", help="SWA analysis")
+def add_swa_arguments(parser_swa, cfg):
+    """Add the options of the SWA analysis module to its subparser."""
+    from src.utils import add_general_arguments
     parser_swa.add_argument("--run", "--run_all", help="Run all steps: processing, visualization. Just Europe is available here", action="store_true")
+    parser_swa.add_argument("-q", "--quiet", help="Hide the progress messages", action="store_true")
+    parser_swa.add_argument("-j", "--jobs", type=int, help="Maximum number of dates processed in parallel processes (default: 4)")
 
     # General options
     swa_group_gen = parser_swa.add_argument_group("General options")
-    swa_group_gen.add_argument("--th_detection_drought", "--threshold", "-th", default=Config().th_detection_drought, type=float, help="Threshold for drought detection")
-    swa_group_gen.add_argument("--start_year", type=int, default=Config().start_year, help="Start year")
-    swa_group_gen.add_argument("--end_year", type=int, default=Config().end_year, help="End year")
-    swa_group_gen.add_argument("--month_start", type=int, default=Config().month_start, help="Start month")
-    swa_group_gen.add_argument("--month_end", type=int, default=Config().month_end, help="End month")
+    add_general_arguments(swa_group_gen, cfg)
 
     # Processing options
     swa_group_proc = parser_swa.add_argument_group("Processing options")
@@ -107,21 +97,17 @@ def main():
     swa_group_vis.add_argument("--raster_path", help="Raster data to plot. Warning be sure the data exists")
 
 
-
-
-    ##### Correlation analysis
-    parser_corr = subparsers.add_parser("correlation", help="Correlation analysis")
+def add_corr_arguments(parser_corr, cfg):
+    """Add the options of the correlation analysis module to its subparser."""
+    from src.utils import add_general_arguments, parse_thresholds
     parser_corr.add_argument("--run", "--run_all", help="Run all steps: compute correlations and visualize", action="store_true")
+    parser_corr.add_argument("--verbose", help="Show the progress messages", action="store_true")
 
     # General options
     corr_group_gen = parser_corr.add_argument_group("General options")
-    corr_group_gen.add_argument("--th_detection_drought", "--threshold", "-th", default=Config().th_detection_drought, type=float, help="Threshold for drought detection")
-    corr_group_gen.add_argument("--start_year", type=int, default=Config().start_year, help="Start year")
-    corr_group_gen.add_argument("--end_year", type=int, default=Config().end_year, help="End year")
-    corr_group_gen.add_argument("--month_start", type=int, default=Config().month_start, help="Start month")
-    corr_group_gen.add_argument("--month_end", type=int, default=Config().month_end, help="End month")
-    corr_group_gen.add_argument("--th_swa_list", type=str, default=Config().TH_SWA_list, help="List of thresholds for SWA in MCC map (comma-separated or tuple '(start,end,step)')")
-    corr_group_gen.add_argument("--th_ya_list", type=str, default=Config().TH_YA_list, help="List of thresholds for Yield Anomaly in MCC map (comma-separated or tuple '(start,end,step)')")
+    add_general_arguments(corr_group_gen, cfg)
+    corr_group_gen.add_argument("--th_swa_list", type=parse_thresholds, default=cfg.TH_SWA_list, help="List of thresholds for SWA in MCC map (comma-separated or tuple '(start,end,step)')")
+    corr_group_gen.add_argument("--th_ya_list", type=parse_thresholds, default=cfg.TH_YA_list, help="List of thresholds for Yield Anomaly in MCC map (comma-separated or tuple '(start,end,step)')")
     corr_group_gen.add_argument("-cp", "--correlation_processing", "--corr", "--correlation", help="Run correlation processing", action="store_true")
     
     # Processing options
@@ -138,66 +124,257 @@ def main():
     corr_group_vis.add_argument("--show_plot", help="Show correlation maps after computation", action="store_true")
     corr_group_vis.add_argument("--save_plot", help="Save correlation maps after computation", action="store_true")
     corr_group_vis.add_argument("--mode_holoviz", type=str, default=None, help="Mode for Holoviz interactive map", choices=["notebook", "browser"])
-    corr_group_vis.add_argument("--th_swa", type=float, default=Config().TH_SWA, help="Threshold for SWA in MCC map")
-    corr_group_vis.add_argument("--th_ya", type=float, default=Config().TH_YA, help="Threshold for Yield Anomaly in MCC map")
-    
+    corr_group_vis.add_argument("--th_swa", type=float, default=cfg.TH_SWA, help="Threshold for SWA in MCC map")
+    corr_group_vis.add_argument("--th_ya", type=float, default=cfg.TH_YA, help="Threshold for Yield Anomaly in MCC map")
 
-    args = parser.parse_args()
 
-    # Dispatch to the correct script
+# Analysis modules : (help, function adding the module options)
+MODULES = {
+    "yield": ("Yield analysis", add_yield_arguments),
+    "swa": ("SWA analysis", add_swa_arguments),
+    "correlation": ("Correlation analysis", add_corr_arguments),
+}
+
+# Scripts run for each module : (module, function), imported only when the module is selected
+SCRIPTS = {
+    "yield": ("scripts.yield_script", "run"),
+    "swa": ("scripts.swa_script", "run"),
+    "correlation": ("scripts.corr_script", "run"),
+}
+
+
+def _sniff_subcommand(argv):
+    """Return the analysis module named in the command line, or None if there is none."""
+    return next((arg for arg in argv[1:] if arg in MODULES), None)
+
+
+def build_info_parser():
+    """Build the parser of the general information options, which do not need the configuration."""
+    info_parser = argparse.ArgumentParser(add_help=False)
+    info_parser.add_argument(*INFO_OPTIONS["version"], action="version", version=VERSION, help="Show program version and exit")
+    info_parser.add_argument(*INFO_OPTIONS["about"], action="store_true", help="Show information about the program and exit")
+    info_parser.add_argument(*INFO_OPTIONS["authors"], action="store_true", help="Show authors of the program and exit")
+    info_parser.add_argument(*INFO_OPTIONS["title"], action="store_true", help="Show the program title and exit")
+    info_parser.add_argument(*INFO_OPTIONS["interactive"], action="store_true", help="Start the interactive mode, to run several commands in a row")
+    return info_parser
+
+
+def print_info(args):
+    """Print the general information requested with --about, --authors or --title.
+    Args:
+        args (argparse.Namespace): The parsed command-line arguments.
+    Returns:
+        bool: True if some information was printed.
+    """
     if args.about:
         print("This program analyzes the relationship between drought conditions (using SWA data) and cereal yield anomalies across various regions.")
         print("Part of my 2025 summer internship at Politecnico di Milano, supervised by Prof. Carmelo Cammalleri.\n")
-        sys.exit(0)
+        return True
     if args.authors:
         print("Internship supervised by Prof Carmelo Cammalleri")
         print("Developed by Enzo Fortin")
-        sys.exit(0)
+        return True
     if args.title:
         print("Analysis and processing of cereals yield datasets as a proxy variable of impacts of drought in agriculture\n")
+        return True
+    return False
+
+
+def build_parser(cfg, modules=MODULES):
+    """Build the parser of the program.
+    Args:
+        cfg (Config): Configuration used for the default values.
+        modules (iterable, optional): Modules whose options are added. The other modules get an empty subparser,
+                                      which is enough for --help. Defaults to all the modules.
+    Returns:
+        argparse.ArgumentParser: The parser, whose module_parsers attribute maps each module to its subparser.
+    """
+    parser = argparse.ArgumentParser(
+        description="Main entry point for drought-swa-yield_anom project.",
+        parents=[build_info_parser()]
+    )
+    subparsers = parser.add_subparsers(dest="module", help="Choose the analysis module to run")
+
+    # Config options
+    parser_config = parser.add_argument_group("Configuration options")
+    parser_config.add_argument("--th_detection_drought", "--threshold", "-th", type=float, default=cfg.th_detection_drought, help="Threshold for drought detection")
+    parser_config.add_argument("--year_start", "--start_year", type=int, default=cfg.year_start, help="Start year")
+    parser_config.add_argument("--year_end", "--end_year", type=int, default=cfg.year_end, help="End year")
+    parser_config.add_argument("--month_start", type=int, default=cfg.month_start, help="Start month")
+    parser_config.add_argument("--month_end", type=int, default=cfg.month_end, help="End month")    
+    parser_config.add_argument("--regions", nargs="+", default=["all"], help="Regions to process", choices=_REGIONS, type=str.lower)
+    parser_config.add_argument("--TH_SWA", "--th_swa", type=float, default=cfg.TH_SWA, help="Threshold for SWA analysis")
+    parser_config.add_argument("--TH_YA", "--th_ya", type=float, default=cfg.TH_YA, help="Threshold for Yield analysis")
+    parser_config.add_argument("--TH_SWA_LIST", "--th_swa_list", nargs="+", type=float, default=cfg.TH_SWA_list, help="List of thresholds for SWA analysis")
+    parser_config.add_argument("--TH_YA_LIST", "--th_ya_list", nargs="+", type=float, default=cfg.TH_YA_list, help="List of thresholds for Yield analysis")
+
+    # Subparsers of the modules : {module: parser}
+    parser.module_parsers = {}
+    for name, (module_help, add_arguments) in MODULES.items():
+        parser_module = subparsers.add_parser(name, help=module_help)
+        if name in modules:
+            add_arguments(parser_module, cfg)
+        parser.module_parsers[name] = parser_module
+
+    return parser
+
+
+def dispatch(args, parser):
+    """Run the script of the selected module, or print the help if no module is selected."""
+    match SCRIPTS.get(args.module):
+        case (module_name, function_name):
+            script = importlib.import_module(module_name)
+            # Scripts can reject invalid option combinations before running, reported with the usage of the module
+            if hasattr(script, "check_args"):
+                script.check_args(args, parser.module_parsers[args.module])
+            getattr(script, function_name)(args)
+        case _:
+            parser.print_help()
+
+
+def main():
+    # General information flags are looked for directly in the options placed before the module name,
+    # so they exit without building any parser or importing the configuration
+    global_args = set(takewhile(lambda arg: arg not in MODULES, sys.argv[1:]))
+    flags = {name for name, options in INFO_OPTIONS.items() if global_args.intersection(options)}
+    if "version" in flags:
+        print(VERSION)
         sys.exit(0)
+    if print_info(argparse.Namespace(**{name: name in flags for name in INFO_OPTIONS})):
+        sys.exit(0)
+    if "interactive" in flags:
+        interactive()
+
+    # Defaults are read from the shared default configuration
+    from src.config import get_config
+    cfg = get_config()
+
+    # Only the options of the selected module are built
+    parser = build_parser(cfg, modules=[_sniff_subcommand(sys.argv)])
+    args = parser.parse_args()
+    if print_info(args):
+        sys.exit(0)
+    if args.interactive:
+        interactive()
+
+    # Dispatch to the correct script
+    dispatch(args, parser)
+
+
+@lru_cache(maxsize=64)
+def split_command(user_input):
+    """Split a command typed in the interactive mode into arguments.
+    Plain whitespace-separated commands are split directly, shlex is only used when quotes or escapes are present.
+    Results are cached, as the same commands are often typed again in a session.
+    Args:
+        user_input (str): The command typed by the user.
+    Returns:
+        tuple: The arguments of the command.
+    """
+    if '"' in user_input or "'" in user_input or "\\" in user_input:
+        return tuple(shlex.split(user_input))
+    return tuple(user_input.split())
+
+
+# Option strings in a formatted help, e.g. -h, --year_start (not the dashes inside words or metavars)
+_OPTION_PATTERN = re.compile(r"(?<![\w-])--?[A-Za-z][\w-]*")
+
+
+def _completion_words(parser):
+    """Collect the words offered by tab completion in the interactive mode: module names and option strings.
+    The options are read from the help of the parser and of its module subparsers.
+    Args:
+        parser (argparse.ArgumentParser): The parser of the interactive mode.
+    Returns:
+        list: The sorted completion words.
+    """
+    words = {"exit", "quit", *parser.module_parsers}
+    for current in (parser, *parser.module_parsers.values()):
+        words.update(_OPTION_PATTERN.findall(current.format_help()))
+    return sorted(words)
+
+
+def _help_module(command):
+    """Return the module whose help is asked for by a command (None for the main help), or False if no help is asked for."""
+    if "-h" not in command and "--help" not in command:
+        return False
+    return next((arg for arg in takewhile(lambda arg: arg not in ("-h", "--help"), command) if arg in MODULES), None)
+
+
+def setup_readline(parser):
+    """Enable the command history and the tab completion of the interactive mode, when readline is available.
+    Args:
+        parser (argparse.ArgumentParser): The parser whose modules and options are completed.
+    """
+    try:
+        import readline
+    except ImportError:  # e.g. on Windows, input() still works without history and completion
+        return
+    words = []
+
+    def complete(text, state):
+        if not words:  # collected at the first completion, so that the helps are not formatted at startup
+            words.extend(_completion_words(parser))
+        matches = [word for word in words if word.startswith(text)]
+        return matches[state] if state < len(matches) else None
+
+    readline.set_completer(complete)
+    readline.set_completer_delims(" \t\n")
+    readline.parse_and_bind("tab: complete")
+
+
+def interactive():
+    """Interactive mode: run several commands in a row until 'exit' or 'quit' is entered.
+    The parser is built once, with the options of all the modules, and reused for every command.
+    Previous commands are kept in the history and modules/options can be completed with tab."""
+    print(" "*10, "--------------------------------------------------------------------------------")
+    print(" "*10, "|   Welcome in the main script for launching the SWA x Yield Anomaly package   |")
+    print(" "*10, "--------------------------------------------------------------------------------\n")
+
+    from src.config import get_config
+    parser = build_parser(get_config())
+    parser.description += "\n\nTo quit the interactive mode, type 'exit' or 'quit' at any prompt."
+    setup_readline(parser)
+    logging.basicConfig(format="%(message)s")
+    # Helps formatted once for each module and terminal width : {(module, columns): help}
+    helps = {}
+
+    # The help is only formatted when it is asked for
+    print("Type --help to see the options.")
+
+    while True:
+        try:
+            user_input = input("\n===> Please enter your command OR 'exit'/'quit' to leave OR --help to display the options : \n")
+        except (EOFError, KeyboardInterrupt):  # Ctrl-D or Ctrl-C at the prompt
+            user_input = "exit"
+            print()
+        if user_input.strip() in ['exit', 'quit']:
+            print("Exiting the program. Goodbye!")
+            sys.exit(0)
+        try:
+            command = split_command(user_input)
+        except ValueError as e:  # e.g. unclosed quotation
+            print(f"Invalid command ({e}). Please check your input and try again")
+            continue
+        module = _help_module(command)
+        if module is not False:
+            key = (module, shutil.get_terminal_size().columns)
+            if key not in helps:
+                helps[key] = (parser if module is None else parser.module_parsers[module]).format_help()
+            print(helps[key], end="")
+            continue
+        try:
+            args = parser.parse_args(list(command))
+            if not print_info(args) and not args.interactive:
+                dispatch(args, parser)
+        except SystemExit as e:
+            if e.code != 0:
+                print("An error occurred while processing your command. Please check your input and try again")
+        except KeyboardInterrupt:  # stops the running command, not the session
+            print("\nCommand interrupted")
+        except Exception as e:  # e.g. a missing data file, the session goes on with the next command
+            logger.error(f"The command failed: {type(e).__name__}: {e}")
 
-    if args.module == "yield":
-        import scripts.yield_script as yield_script
-        yield_script.run(args)
-    elif args.module == "swa":
-        import scripts.swa_script as swa_script
-        swa_script.run(args)
-    elif args.module == "correlation":
-        import scripts.corr_script as corr_script
-        corr_script.run(args)
-    else:
-        parser.print_help()
 
 if __name__ == "__main__":
-        # print(" "*10, "--------------------------------------------------------------------------------")
-        # print(" "*10, "|   Welcome in the main script for launching the SWA x Yield Anomaly package   |")
-        # print(" "*10, "--------------------------------------------------------------------------------\n")
-
-        # parser = ArgumentParser(
-        #     description="Main entry point for drought-swa-yield_anom project."
-        # )
-        # parser.description += "\n\nTo quit the interactive mode, type 'exit' or 'quit' at any prompt."
-        # subparsers = parser.add_subparsers(dest="module", help="Choose the analysis module to run")
-        # subparsers.add_parser("yield", help="Yield analysis")
-        # subparsers.add_parser("swa", help="SWA analysis")
-        # subparsers.add_parser("correlation", help="Correlation analysis")
-
-        # print(parser.format_help())
-
-        # while True:
-        #     user_input = input("\n===> Please enter your command OR 'exit'/'quit' to leave OR --help to display the options : \n")
-        #     if user_input in ['exit', 'quit']:
-        #         print("Exiting the program. Goodbye!")
-        #         sys.exit(0)
-        #     else:
-        #         sys.argv = [sys.argv[0]] + shlex.split(user_input)
-        #         try:
-        #             main()
-        #         except SystemExit as e:
-        #             if e.code != 0:
-        #                 print("An error occurred while processing your command. Please check your input and try again")
-        #                 continue
-        #             else:
-        #                 continue
-    main()
\ No newline at end of file
+    main()
@@ -6,19 +6,41 @@
 # This file contains scripts to compute and visualize correlation maps.
 # --------------------------------------------------------------
 import argparse
-import src.correlation.correlation as cr
-import src.correlation.visualization as vz
-from src.config import Config
+import logging
+from src.config import Config, get_config
+from src.utils import add_general_arguments, parse_thresholds
+
+# Options selecting the correlation maps to plot
+_PLOT_OPTIONS = ("plot_mcc_map", "plot_max_mcc_map", "display_interactive_map_holoviz", "display_interactive_map_matplotlib")
+
+logger = logging.getLogger(__name__)
+
+
+def check_args(args, parser):
+    """Stop with a usage error on option combinations that would compute maps without any output.
+    Args:
+        args (argparse.Namespace): The parsed command-line arguments.
+        parser (argparse.ArgumentParser): The parser reporting the error.
+    """
+    if getattr(args, "run", False):  # --run sets the plot options itself
+        return
+    save_plot, show_plot = getattr(args, "save_plot", False), getattr(args, "show_plot", False)
+    plots = [option for option in _PLOT_OPTIONS if getattr(args, option, False)]
+    if plots and not (save_plot or show_plot):
+        parser.error(f"--{plots[0]} needs --save_plot or --show_plot")
+    interactive_maps = [option for option in _PLOT_OPTIONS[2:] if getattr(args, option, False)]
+    if interactive_maps and not show_plot:
+        parser.error(f"--{interactive_maps[0]} needs --show_plot")
 
 
 
 def run(args):
-    print("\n############ CORRELATION SCRIPT ################\n")
+    # Status messages are only shown with --verbose, warnings always
+    logging.basicConfig(format="%(message)s")
+    logger.setLevel(logging.INFO if getattr(args, "verbose", False) else logging.WARNING)
+    logger.info("\n############ CORRELATION SCRIPT ################\n")
 
     config = Config.from_args(args)
-    
-    cr.config = config  # update config in correlation
-    vz.config = config  # update config in visualization
 
 
     # Run arguments
@@ -34,39 +56,51 @@ def run(args):
         args.save_plot = True
 
     if getattr(args, "correlation_processing", False):
-        print("Computing correlation maps...")
+        logger.info("Computing correlation maps...")
+        # Imported only when needed, as xarray and scikit-learn are slow to load
+        import src.correlation.correlation as cr
+        cr.config = config  # update config in correlation
         cr.main(netcdf=getattr(args, "save_data", None) in ["netcdf", "both"], excel=getattr(args, "save_data", None) in ["excel", "both"])
         
 
-    if getattr(args, "visualization", False):
-        print("Visualizing correlation maps...")
+    save_plot, show_plot = getattr(args, "save_plot", False), getattr(args, "show_plot", False)
+    if getattr(args, "visualization", False) and not (save_plot or show_plot):
+        # The figures would be neither saved nor shown
+        logger.warning("Neither --save_plot nor --show_plot is set, skipping the visualization of correlation maps.")
+    elif getattr(args, "visualization", False) and not any(getattr(args, option, False) for option in _PLOT_OPTIONS):
+        # The correlation results are only loaded when a map uses them
+        logger.warning(f"No map selected ({', '.join('--' + option for option in _PLOT_OPTIONS)}), skipping the visualization of correlation maps.")
+    elif getattr(args, "visualization", False):
+        logger.info("Visualizing correlation maps...")
+        # Imported only when needed, as holoviews, panel and matplotlib are slow to load
+        import src.correlation.visualization as vz
+        vz.config = config  # update config in visualization
         ds = vz.load_correlation_results()
         if getattr(args, "plot_mcc_map", False):
-            vz.plot_mcc_map(ds, th_swa=config.TH_SWA, th_ya=config.TH_YA, save=getattr(args, "save_plot", False), show=getattr(args, "show_plot", False))
+            vz.plot_mcc_map(ds, th_swa=config.TH_SWA, th_ya=config.TH_YA, save=save_plot, show=show_plot)
         if getattr(args, "plot_max_mcc_map", False):
-            vz.plot_max_mcc_map(ds, save=getattr(args, "save_plot", False), show=getattr(args, "show_plot", False))
-        if getattr(args, "display_interactive_map_holoviz", False) and getattr(args, "show_plot", False):
+            vz.plot_max_mcc_map(ds, save=save_plot, show=show_plot)
+        if getattr(args, "display_interactive_map_holoviz", False) and show_plot:
             vz.holoviz_interactive_mcc(ds, mode=getattr(args, "mode_holoviz", None))
-        if getattr(args, "display_interactive_map_matplotlib", False) and getattr(args, "show_plot", False):
+        if getattr(args, "display_interactive_map_matplotlib", False) and show_plot:
             vz.interactive_mcc_map(ds)
-        print("Visualization done.")
+        logger.info("Visualization done.")
 
 
 
 
 if __name__ == "__main__":
+    defaults = get_config()
+
     parser = argparse.ArgumentParser(description="Compute and visualize correlation maps.")
     parser.add_argument("-r", "--run", "--run_all", help="Run all steps: compute correlations and visualize", action="store_true")
+    parser.add_argument("--verbose", help="Show the progress messages", action="store_true")
 
     # General options
     group_gen = parser.add_argument_group("General options")
-    group_gen.add_argument("--th_detection_drought", "--threshold", "-th", default=Config().th_detection_drought, type=float, help="Threshold for drought detection")
-    group_gen.add_argument("--year_start", type=int, default=Config().year_start, help="Start year")
-    group_gen.add_argument("--year_end", type=int, default=Config().year_end, help="End year")
-    group_gen.add_argument("--month_start", type=int, default=Config().month_start, help="Start month")
-    group_gen.add_argument("--month_end", type=int, default=Config().month_end, help="End month")
-    group_gen.add_argument("--th_swa_list", type=str, default=Config().TH_SWA_list, help="List of thresholds for SWA in MCC map (comma-separated or tuple '(start,end,step)')")
-    group_gen.add_argument("--th_ya_list", type=str, default=Config().TH_YA_list, help="List of thresholds for Yield Anomaly in MCC map (comma-separated or tuple '(start,end,step)')")
+    add_general_arguments(group_gen, defaults)
+    group_gen.add_argument("--th_swa_list", type=parse_thresholds, default=defaults.TH_SWA_list, help="List of thresholds for SWA in MCC map (comma-separated or tuple '(start,end,step)')")
+    group_gen.add_argument("--th_ya_list", type=parse_thresholds, default=defaults.TH_YA_list, help="List of thresholds for Yield Anomaly in MCC map (comma-separated or tuple '(start,end,step)')")
     group_gen.add_argument("-cp", "--correlation_processing", "--corr", "--correlation", help="Run correlation processing", action="store_true")
     
     # Processing options
@@ -83,9 +117,10 @@ if __name__ == "__main__":
     group_vis.add_argument("--show_plot", help="Show correlation maps after computation", action="store_true")
     group_vis.add_argument("--save_plot", help="Save correlation maps after computation", action="store_true")
     group_vis.add_argument("--mode_holoviz", type=str, default=None, help="Mode for Holoviz interactive map", choices=["notebook", "browser"])
-    group_vis.add_argument("--th_swa", type=float, default=Config().TH_SWA, help="Threshold for SWA in MCC map")
-    group_vis.add_argument("--th_ya", type=float, default=Config().TH_YA, help="Threshold for Yield Anomaly in MCC map")
+    group_vis.add_argument("--th_swa", type=float, default=defaults.TH_SWA, help="Threshold for SWA in MCC map")
+    group_vis.add_argument("--th_ya", type=float, default=defaults.TH_YA, help="Threshold for Yield Anomaly in MCC map")
     
     
     args = parser.parse_args()
+    check_args(args, parser)
     run(args)
\ No newline at end of file
@@ -6,17 +6,25 @@
 # This file contains scripts to analyze swa data for various regions.
 # --------------------------------------------------------------
 import argparse
-import src.swa_analysis.data_processing as dp
-import src.swa_analysis.visualization as vz
+import logging
 from src.config import Config
+from src.utils import add_general_arguments
+
+logger = logging.getLogger(__name__)
 
 
 
 def run(args):
-    print("\n############ SWA ANALYSIS SCRIPT ################\n")
+    # Status messages are shown unless --quiet is given, warnings always
+    logging.basicConfig(format="%(message)s")
+    logger.setLevel(logging.WARNING if getattr(args, "quiet", False) else logging.INFO)
+    logger.info("\n############ SWA ANALYSIS SCRIPT ################\n")
 
     config = Config.from_args(args)
-    
+
+    # Imported here so that the parser (e.g. --help) does not load rasterio, geopandas and cartopy
+    import src.swa_analysis.data_processing as dp
+    import src.swa_analysis.visualization as vz
     dp.config = config  # update config in data_processing
     vz.config = config  # update config in visualization
 
@@ -31,33 +39,34 @@ def run(args):
 
     ### SWA Data Processing
     if args.data_processing:
-        print("> Processing of SWA data")
+        logger.info("> Processing of SWA data")
         dp.run_swa(
             threshold=config.th_detection_drought,
             year_start=config.year_start,
             year_end=config.year_end,
             month_start=config.month_start,
-            month_end=config.month_end
+            month_end=config.month_end,
+            max_workers=dp.DEFAULT_MAX_WORKERS if getattr(args, "jobs", None) is None else args.jobs
         )
-        print("Data processing completed\n")    
+        logger.info("Data processing completed\n")    
 
 
     ### SWA Data Visualization
     if getattr(args, "visualization", False):
-        print("> Visualization of SWA data")
+        logger.info("> Visualization of SWA data")
         if getattr(args, "plot_time_series", False):
-            print("     > Plotting temporal series for Europe")
+            logger.info("     > Plotting temporal series for Europe")
             dp.temporal_series_region(year_start=config.year_start,year_end=config.year_end, month_start=config.month_start, month_end=config.month_end, save=False, show=getattr(args, "show_plot", False), save_plot=getattr(args, "save_plot", False), threshold=config.th_detection_drought)
-            print("     Temporal series plotted")
-        print("Visualization completed\n")
+            logger.info("     Temporal series plotted")
+        logger.info("Visualization completed\n")
 
         if getattr(args, "plot_raster", False):
-            print("     > Plotting raster data")
+            logger.info("     > Plotting raster data")
             if getattr(args, "raster_path", None) is not None:
                 vz.plot_raster(raster=dp.open_raster(getattr(args, "raster_path", None)), cmap="RdBu", save=getattr(args, "save_plot", False), show=getattr(args, "show_plot", False))
             else:
-                print("     No raster path provided. Skipping raster plot.")
-            print("     Raster data plotted")
+                logger.info("     No raster path provided. Skipping raster plot.")
+            logger.info("     Raster data plotted")
 
         # to complete
 
@@ -66,14 +75,12 @@ def run(args):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Analyze SWA data for various regions.")
     parser.add_argument("--run", "--run_all", help="Run all steps: processing, visualization. Just Europe is available here", action="store_true")
+    parser.add_argument("-q", "--quiet", help="Hide the progress messages", action="store_true")
+    parser.add_argument("-j", "--jobs", type=int, help="Maximum number of dates processed in parallel processes (default: 4)")
 
-    # General options
+    # General options, absent from args when not given so the configuration defaults are used
     group_gen = parser.add_argument_group("General options")
-    group_gen.add_argument("--th_detection_drought", "--threshold", "-th", type=float, help="Threshold for drought detection")
-    group_gen.add_argument("--year_start", type=int, help="Start year")
-    group_gen.add_argument("--year_end", type=int, help="End year")
-    group_gen.add_argument("--month_start", type=int, help="Start month")
-    group_gen.add_argument("--month_end", type=int, help="End month")
+    add_general_arguments(group_gen)
 
     # Processing options
     group_proc = parser.add_argument_group("Processing options")
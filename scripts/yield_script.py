@@ -5,21 +5,204 @@
 # Description :
 # This file contains scripts to standardize and analyze yield data for various regions.
 # --------------------------------------------------------------
-import argparse
-import src.yield_analysis.data_standardization as ds
-import src.yield_analysis.data_processing as dp
-import src.yield_analysis.visualization as vz
+import logging
+import importlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+import numpy as np
+import src.utils as utils
 from src.config import Config
 
+try:
+    from threadpoolctl import threadpool_limits  # installed with scikit-learn
+except ImportError:
+    threadpool_limits = None
+
+# Regions accepted by the --regions option
+_REGIONS = ("europe", "usa", "china", "india", "canada", "argentina", "brazil", "all")
+_REGIONS_TO_STANDARDIZE = tuple(Config.DEFAULT_REGIONS_TO_STANDARDIZE)  # every region but europe, in canonical order
+
+# Analysis modules, imported by the steps that use them (visualization loads matplotlib and cartopy) : name in this script -> module
+_ANALYSIS_MODULES = {
+    "ds": "src.yield_analysis.data_standardization",
+    "dp": "src.yield_analysis.data_processing",
+    "vz": "src.yield_analysis.visualization",
+}
+ds = dp = vz = None
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- REGIONS WORKERS -----------------------------------
+# Regions are independent (separate input files and outputs), so they can be processed in parallel processes (--jobs)
+def _use_modules(config, *names):
+    """Import the analysis modules on first use and set their configuration if it changed.
+    Args:
+        config (Config): Configuration of the modules.
+        *names (str): Names of the modules in this script ("ds", "dp", "vz").
+    """
+    for name in names:
+        module = globals()[name] or importlib.import_module(_ANALYSIS_MODULES[name])
+        if module.config is not config:
+            module.config = config
+        globals()[name] = module
+
+
+def _init_worker(config, log_level, names):
+    """Set the analysis modules used by the parent process and the log level in a worker process."""
+    # One thread per worker for the numerical libraries, the regions already use the cores
+    for variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[variable] = "1"
+    if threadpool_limits is not None:  # numpy is already loaded, its thread pools are limited at runtime
+        threadpool_limits(limits=1)
+    _use_modules(config, *names)
+    logging.basicConfig(format="%(message)s")  # no-op if the handler is inherited from the parent process
+    logger.setLevel(log_level)
+    utils.show_progress = False  # the bars of the workers would be mixed on the terminal, the region messages are kept
+
+
+# Area covered by the anomalies of the last regions computed in this process : {key: data}
+_AREA_COVERED = {}
+_AREA_COVERED_SIZE = len(_REGIONS_TO_STANDARDIZE) + 1  # every region once
+
+
+def _area_covered_cached(region, sel_years):
+    """Area covered by the anomalies of a region (dp.process_area_covered), computed once for the same region,
+    years and standardized data. The modification times of the standardized files are part of the key,
+    so data standardized again are processed again.
+    Args:
+        region (str): The region.
+        sel_years (tuple): Year range (start, end).
+    Returns:
+        dict: The data of dp.process_area_covered, for vz.plot_area_covered.
+    """
+    data_dir = f"{dp.config.yield_config.DATA_STANDARDIZED_DIR}/{region}"
+    files = (f"{data_dir}/prod_{region}_standardized.xlsx", f"{data_dir}/area_{region}_standardized.xlsx")
+    key = (region, tuple(sel_years), -2.5, 0, 0.5, True, *((file, os.path.getmtime(file)) for file in files))
+    if key not in _AREA_COVERED:
+        if len(_AREA_COVERED) >= _AREA_COVERED_SIZE:
+            del _AREA_COVERED[next(iter(_AREA_COVERED))]  # oldest region or standardized data
+        _AREA_COVERED[key] = dp.process_area_covered(region, sel_years=sel_years, thresh_min=-2.5, thresh_max=0, step=0.5, inf=True)
+    return _AREA_COVERED[key]
+
+
+def _standardized_regions(regions):
+    """Standardize the yield data of the regions, yielding each region once its files are saved.
+    Args:
+        regions (list): The regions, the european data is copied as it is already standardized.
+    Yields:
+        str: The regions whose standardized data is saved.
+    """
+    ds.copy_european_data()
+    if "europe" in regions:
+        yield "europe"
+    for region, dfs in ds.iter_standardized_data():
+        ds.save_data(dfs)  # each region is saved and released before the next one is read
+        yield region
+
+
+def _process_region(region):
+    """Compute and save the production anomalies of a region."""
+    dp.get_prod_anom(region, save=True)
+
+
+def _plot_area_covered(region, sel_years, **kwargs):
+    """Plot the area covered series of a region from its cached computation."""
+    vz.plot_area_covered(region, _area_covered_cached(region, sel_years), thresh_min=-2.5, thresh_max=0, step=0.5, inf=True, **kwargs)
+
+
+def _plot_plan(options):
+    """Select the figures to plot once for all the regions.
+    Args:
+        options (dict): The plot options of the command line.
+    Returns:
+        list: (name, function, kwargs) of each selected plot, called as function(region, **kwargs).
+    """
+    plot_series, plot_map, plot_area = options.get("plot_anomaly_series", False), options.get("plot_anomaly_map", False), options.get("plot_area_covered", False)
+    save_plot, show_plot = options.get("save_plot", False), options.get("show_plot", False)
+    sel_years = (options["year_start"], options["year_end"])  # shared by the plots of all the regions, not modified by them
+    all_plots = not (plot_series or plot_map or plot_area)
+
+    plots = []
+    if plot_series or all_plots:
+        plots.append(("Anomaly Series", vz.plot_anomaly_series, dict(type=options.get("anomaly_type", "normalized"), save=save_plot, show=show_plot)))
+    if plot_map or all_plots:
+        plots.append(("Anomaly Map", vz.plot_anomaly_map, dict(anomaly=options.get("anomaly_map", "neg"), sel_years=sel_years, save=save_plot, show=show_plot)))
+    if plot_area or all_plots:
+        plots.append(("Area Covered Series", _plot_area_covered, dict(sel_years=sel_years, save=save_plot, show=show_plot)))
+    return plots
 
-def run(args):
-    print("\n############ YIELD ANALYSIS SCRIPT ################\n")
 
-    config = Config.from_args(args)
+def _visualize_region(region, plots):
+    """Plot the selected figures of a region.
+    Args:
+        region (str): The region to plot.
+        plots (list): The plots selected by _plot_plan.
+    """
+    logger.info(f"     > Region: {region}")
+    for name, function, kwargs in plots:
+        logger.info(f"         > Plotting {name}")
+        function(region, **kwargs)
+        logger.info(f"         {name} saved")
+    logger.info(f"     Region {region} completed")
 
-    ds.config = config  # update config in data_standardization
-    dp.config = config  # update config in data_processing
-    vz.config = config  # update config in visualization
+
+def map_regions(function, regions, config, *args, jobs=1):
+    """Call function(region, *args) for each region, in a pool of processes when several jobs are allowed.
+    Args:
+        function (callable): Module-level function run for each region.
+        regions (list or iterable): The regions, a region given by an iterator is submitted as soon as it is produced.
+        config (Config): Configuration set in the worker processes.
+        *args: Other arguments of the function, the same for all the regions.
+        jobs (int, optional): Maximum number of regions processed at the same time. With 1, the regions are run
+                              one after the other in this process (e.g. to show the plots). Defaults to 1.
+    """
+    workers = min(jobs, len(regions) if isinstance(regions, list) else len(config.regions_list), os.cpu_count() or 1)
+    if workers < 2:
+        for region in regions:
+            function(region, *args)
+        return
+    names = [name for name in _ANALYSIS_MODULES if globals()[name] is not None]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config, logger.level, names)) as executor:
+        # Consuming the results raises the errors of the workers
+        list(executor.map(function, regions, *(repeat(arg) for arg in args)))
+# --------------------------------------------------------------
+
+
+def _args_key(args):
+    """Hashable key of the command-line arguments (lists and arrays converted to tuples)."""
+    return tuple(sorted((name, tuple(value) if isinstance(value, (list, np.ndarray)) else value) for name, value in vars(args).items()))
+
+
+# Configurations of the last arguments : {arguments key: Config}
+_CONFIGS = {}
+_CONFIGS_SIZE = 8
+
+
+def config_from_args(args, **parameters):
+    """Configuration of a set of arguments, built once for the same arguments (e.g. commands repeated in the interactive mode).
+    The returned configuration is shared by the runs with the same key and must not be modified.
+    Args:
+        args (argparse.Namespace): The parsed command-line arguments, with the regions already normalized.
+        **parameters: Other parameters of the Config (e.g. regions_list), part of the key.
+    Returns:
+        Config: The configuration.
+    """
+    key = (_args_key(args), tuple(sorted(parameters.items())))
+    if key not in _CONFIGS:
+        if len(_CONFIGS) >= _CONFIGS_SIZE:
+            del _CONFIGS[next(iter(_CONFIGS))]  # oldest configuration
+        _CONFIGS[key] = Config.from_args(args, **parameters)
+    return _CONFIGS[key]
+
+
+def run(args):
+    # Status messages are shown unless --quiet is given, warnings always
+    logging.basicConfig(format="%(message)s")
+    logger.setLevel(logging.WARNING if getattr(args, "quiet", False) else logging.INFO)
+    logger.info("\n############ YIELD ANALYSIS SCRIPT ################\n")
 
     # Run arguments
     if getattr(args, "run", False):
@@ -34,75 +217,89 @@ def run(args):
         args.save_plot = True
         args.show_plot = False
 
-    if args.regions == ["all"]:
-        config.regions_list = ["europe", "usa", "china", "india", "canada", "argentina", "brazil"]
+    # Options read once
+    options = vars(args)
+    save_plot, show_plot = options.get("save_plot", False), options.get("show_plot", False)
+    jobs = 1 if options.get("jobs") is None else options["jobs"]
+    if jobs < 1:
+        raise ValueError(f"Invalid number of jobs: {jobs}. It must be at least 1")
+
+    # Regions normalized once to a list ("all" can be given as a string by default and by --run)
+    regions = args.regions if isinstance(args.regions, list) else [args.regions]
+    if "all" in regions:
+        regions = list(Config.DEFAULT_REGIONS_LIST)
+    # Checked before any step, run() can be called without the parser choices
+    invalid_regions = [region for region in regions if region not in Config.DEFAULT_REGIONS_LIST]
+    if invalid_regions:
+        raise ValueError(f"Invalid regions: {invalid_regions}. Valid regions are: {Config.DEFAULT_REGIONS_LIST}")
+    args.regions = regions
+    if set(regions).issuperset(_REGIONS_TO_STANDARDIZE):
+        regions_to_standardize = _REGIONS_TO_STANDARDIZE
+    else:
+        regions_to_standardize = tuple(r for r in regions if r != "europe")
+
+    # Built after the regions are normalized, the cached configuration is not modified by the run
+    config = config_from_args(args, regions_list=tuple(regions), regions_to_standardize=regions_to_standardize)
+
+    standardization = options.get("data_standardization", False)
+    prod_anom = options.get("data_processing", False) and options.get("get_prod_anom", False)
 
     ### Yield Data Standardization
-    if getattr(args, "data_standardization", False):
-        print("> Standardization of yield data")
-        ds.copy_european_data()
-        config.regions_to_standardize = [r for r in args.regions if r != "europe"]
-        ds.save_data(ds.standardize_data())
-        print("Data standardization completed\n")
+    if standardization:
+        logger.info("> Standardization of yield data")
+        _use_modules(config, "ds")
+        standardized = _standardized_regions(args.regions)
+        if prod_anom:
+            # The production anomalies of a region are computed while the next regions are standardized
+            logger.info("     > Getting production anomalies for regions as they are standardized")
+            _use_modules(config, "dp")
+            map_regions(_process_region, standardized, config, jobs=jobs)
+            logger.info("     Production anomalies saved")
+        else:
+            for _ in standardized:
+                pass
+        logger.info("Data standardization completed\n")
 
 
     ### Yield Data Processing
-    if getattr(args, "data_processing", False):
-        print("> Processing of yield data")
-        if getattr(args, "get_prod_anom", False):
-            print("     > Getting production anomalies for regions")
-            for region in args.regions:
-                dp.get_prod_anom(region, save=True)
-            print("     Production anomalies saved")
-        print("Data processing completed\n")
+    if options.get("data_processing", False):
+        logger.info("> Processing of yield data")
+        _use_modules(config, "dp")
+        if prod_anom and not standardization:  # otherwise computed with the standardization
+            logger.info("     > Getting production anomalies for regions")
+            map_regions(_process_region, args.regions, config, jobs=jobs)
+            logger.info("     Production anomalies saved")
+        logger.info("Data processing completed\n")
 
 
     ### Yield Data Visualization
-    if getattr(args, "visualization", False):
-        print("> Visualization of yield data")
-        if not getattr(args, "save_plot"):
-            print("! WARNING : Plots will not be saved unless --save_plot is specified !")
-
-        all_plots = not (getattr(args, "plot_anomaly_series", False) or getattr(args, "plot_anomaly_map", False) or getattr(args, "plot_area_covered", False))
-        for region in args.regions:
-            print(f"     > Region: {region}")
-            if getattr(args, "plot_anomaly_series", False) or all_plots:
-                print("         > Plotting Anomaly Series")
-                vz.plot_anomaly_series(region, type=getattr(args, "anomaly_type", "normalized"), save=getattr(args, "save_plot"), show=getattr(args, "show_plot"))
-                print("         Anomaly series saved")
-            if getattr(args, "plot_anomaly_map", False) or all_plots:
-                print("         > Plotting Anomaly Map")
-                vz.plot_anomaly_map(region, anomaly=getattr(args, "anomaly_map", "neg"), sel_years=[args.year_start, args.year_end], save=getattr(args, "save_plot"), show=getattr(args, "show_plot"))
-                print("         Anomaly map saved")
-            if getattr(args, "plot_area_covered", False) or all_plots:
-                print("         > Plotting Area Covered Series")
-                vz.plot_area_covered(
-                    region,
-                    dp.process_area_covered(region, sel_years=[args.year_start, args.year_end], thresh_min=-2.5, thresh_max=0, step=0.5, inf=True),
-                    save=getattr(args, "save_plot", False),
-                    show=getattr(args, "show_plot", False),
-                    thresh_min=-2.5,
-                    thresh_max=0,
-                    step=0.5,
-                    inf=True
-                )
-                print("         Area covered series saved")
-            print(f"     Region {region} completed")
-        print("Visualization completed\n")
+    if options.get("visualization", False):
+        logger.info("> Visualization of yield data")
+        _use_modules(config, "dp", "vz")
+        if not save_plot:
+            logger.warning("! WARNING : Plots will not be saved unless --save_plot is specified !")
 
+        # Figures can only be shown from this process
+        map_regions(_visualize_region, args.regions, config, _plot_plan(options), jobs=1 if show_plot else jobs)
+        logger.info("Visualization completed\n")
 
 
-if __name__ == "__main__":
-    from src.config import config
 
+@lru_cache(maxsize=1)
+def _build_parser():
+    """Build the standalone command line parser once."""
+    import argparse
+    from src.config import config
 
     ### General options
     parser = argparse.ArgumentParser(description="Standardize and analyze yield data for various regions.")
     parser.add_argument("-r", "--run", "--run_all", help="Run all steps: standardization, processing, visualization", action="store_true")
+    parser.add_argument("-q", "--quiet", help="Hide the progress messages", action="store_true")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of regions processed in parallel processes (default: 1, one region after the other)")
     
 
     ### Configuration options
-    parser.add_argument("--regions", nargs="+", default=["europe", "usa", "china", "india", "canada", "argentina", "brazil"], help="Regions to standardize", choices=["europe", "usa", "china", "india", "canada", "argentina", "brazil", "all"], type=str)
+    parser.add_argument("--regions", nargs="+", default=["europe", "usa", "china", "india", "canada", "argentina", "brazil"], help="Regions to standardize", choices=_REGIONS, type=str.lower)
     parser.add_argument("--year_start", type=int, default=config.year_start, help="Start year for analysis (default: 1991)")
     parser.add_argument("--year_end", type=int, default=config.year_end, help="End year for analysis (default: 2023)")
 
@@ -133,7 +330,9 @@ if __name__ == "__main__":
     group_vis.add_argument("--anomaly_map", type=str, default="neg", choices=["neg", "pos"], help="Type of anomaly map to plot. 'neg' for negative anomalies, 'pos' for positive anomalies")
     
     
-    args = parser.parse_args()
-    run(args)
+    return parser
 
 
+if __name__ == "__main__":
+    args = _build_parser().parse_args()
+    run(args)
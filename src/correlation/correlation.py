@@ -8,11 +8,10 @@
 # --------------------------------------------------------------
 import src.utils as utils
 import os
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-import warnings
 import xarray as xr
 import numpy as np
-from sklearn.metrics import matthews_corrcoef
 
 config = None  # to be set from outside
 
@@ -47,9 +46,13 @@ def read_excel_data(file_path):
     Returns:
         ...
     """
-    with pd.ExcelFile(file_path) as xls:
-        df = pd.read_excel(xls, header=0, index_col=0)
-    return df
+    # python-calamine (optional) parses the file much faster than openpyxl
+    try:
+        import python_calamine  # noqa: F401
+        reader_kwargs = {"engine": "calamine"}
+    except ImportError:
+        reader_kwargs = {}
+    return pd.read_excel(file_path, header=0, index_col=0, **reader_kwargs)
 
 def add_european_average(df):
     """Add a column with the sum of all NUTS regions in Europe for all years (index).
@@ -68,15 +71,15 @@ def add_european_boolean_sum(df):
     Returns:
         pd.DataFrame: DataFrame with an additional column for the sum of all NUTS regions.    
     """
-    df["EUROPE_SUM"] = df.sum(axis=1)
+    df["EUROPE_SUM"] = df.to_numpy().sum(axis=1)  # boolean data has no NaN to skip
     return df
 
 def bool_data_threshold(arr, data_type, threshold):
-    """Vectorized thresholding using NumPy for speed."""
+    """Vectorized thresholding using NumPy for speed. Returns a boolean mask, counted as integers by the MCC."""
     if data_type == "swa":
-        mask = (arr >= threshold).astype(np.int8)
+        mask = arr >= threshold
     elif data_type == "ya":
-        mask = (arr <= threshold).astype(np.int8)
+        mask = arr <= threshold
     else:
         raise ValueError("data_type must be either swa or ya")
     return mask
@@ -109,9 +112,13 @@ def save_to_netcdf(ds):
     ds["region"].attrs["long_name"] = "NUTS regions"
     ds["region"].attrs["units"] = "unitless"
     
+    # The results are small: one compressed chunk, written in a single operation.
+    # MCC values are in [-1, 1], float32 keeps 7 significant digits
+    encoding = {"MCC": {"zlib": True, "complevel": 3, "chunksizes": ds["MCC"].shape, "dtype": "float32"}}
+
     os.makedirs(config.corr_config.CORR_RESULTS_DIR, exist_ok=True)
     try:
-        ds.to_netcdf(f"{config.corr_config.CORR_RESULTS_DIR}/mcc_results.nc", format="NETCDF4", engine="h5netcdf")
+        ds.to_netcdf(f"{config.corr_config.CORR_RESULTS_DIR}/mcc_results.nc", format="NETCDF4", engine="h5netcdf", encoding=encoding)
     except Exception as e:
         print(f"Error saving to NetCDF: {e}")
         ds.to_netcdf(f"{config.corr_config.CORR_RESULTS_DIR}/mcc_results.nc")
@@ -120,38 +127,50 @@ def save_to_excel(df):
     """Save the MCC DataArray results to an Excel file with one sheet per region and a summary sheet."""
     excel_df = df.to_dataframe().reset_index()
     output_path = f"{config.corr_config.CORR_RESULTS_DIR}/mcc_results.xlsx"
-    with pd.ExcelWriter(output_path) as writer:
+    # xlsxwriter (optional) is faster than openpyxl for writing. Its constant_memory mode can not be used:
+    # pandas writes the cells column by column, and that mode only keeps the current row
+    try:
+        import xlsxwriter  # noqa: F401
+        writer_kwargs = {"engine": "xlsxwriter"}
+    except ImportError:
+        writer_kwargs = {}
+    os.makedirs(config.corr_config.CORR_RESULTS_DIR, exist_ok=True)
+    with pd.ExcelWriter(output_path, **writer_kwargs) as writer:
         excel_df.to_excel(writer, sheet_name="All regions", index=False)
-        for region in df.region.values:
-            region_df = excel_df[excel_df["region"] == region].drop(columns=["region"])
-            region_df.to_excel(writer, sheet_name=str(region), index=False)
+        # One pass over the rows to split them by region
+        for region, region_df in excel_df.groupby("region", sort=False):
+            region_df.drop(columns=["region"]).to_excel(writer, sheet_name=str(region), index=False)
 
 def compute_mcc_xarray(ds_swa, ds_ya, th_swa_list, th_ya_list):
     """
     Compute MCC for all regions and all threshold combinations using xarray.
+    The binary series of all the thresholds are built at once, and the confusion counts of every
+    (TH_SWA, TH_YA, region) combination come from a single product over time.
     Args:
         ds_swa (xr.DataArray): dims ("time", "region")
         ds_ya (xr.DataArray): dims ("time", "region")
-        th_swa_list (list): thresholds for SWA
-        th_ya_list (list): thresholds for YA
+        th_swa_list (list or np.ndarray): thresholds for SWA
+        th_ya_list (list or np.ndarray): thresholds for YA
     Returns:
         xr.DataArray: dims ("TH_SWA", "TH_YA", "region"), MCC values
     """
     regions = ds_swa.region.values
-    mcc_array = np.zeros((len(th_swa_list), len(th_ya_list), len(regions)))
-    total = len(th_swa_list) * len(th_ya_list)
-    step = 0
-    for i, th_swa in enumerate(th_swa_list):
-        swa_bin = bool_data_threshold(ds_swa.values, "swa", th_swa)
-        for j, th_ya in enumerate(th_ya_list):
-            ya_bin = bool_data_threshold(ds_ya.values, "ya", th_ya)
-            for k, region in enumerate(regions):
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore", category=UserWarning)
-                    mcc = matthews_corrcoef(swa_bin[:, k], ya_bin[:, k])
-                mcc_array[i, j, k] = mcc
-            step += 1
-            utils.progress_bar(step, total, prefix="Computing MCC:", suffix="Complete", bar_length=40)
+    # Binary series for each threshold: (threshold, time, region)
+    swa_bin = bool_data_threshold(ds_swa.values, "swa", np.asarray(th_swa_list)[:, None, None])
+    ya_bin = bool_data_threshold(ds_ya.values, "ya", np.asarray(th_ya_list)[:, None, None])
+
+    # Confusion counts: (TH_SWA, TH_YA, region)
+    n = swa_bin.shape[1]
+    tp = np.einsum("itr,jtr->ijr", swa_bin, ya_bin, dtype=np.int64)
+    n_swa = swa_bin.sum(axis=1, dtype=np.int64)[:, None, :]
+    n_ya = ya_bin.sum(axis=1, dtype=np.int64)[None, :, :]
+    fp, fn = n_swa - tp, n_ya - tp
+    tn = n - tp - fp - fn
+
+    # MCC, set to 0 when one of the series is constant (as sklearn's matthews_corrcoef)
+    numerator = (tp * tn - fp * fn).astype(float)
+    denominator = np.sqrt((n_swa * (n - n_swa) * n_ya * (n - n_ya)).astype(float))
+    mcc_array = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
     return xr.DataArray(
         mcc_array,
         coords={
@@ -178,8 +197,14 @@ def main(netcdf=False, excel=False):
     mcc_ds = compute_mcc_xarray(ds_swa, ds_ya, config.TH_SWA_list, config.TH_YA_list)
     mcc_ds.name = "MCC"
 
-    if netcdf: save_to_netcdf(mcc_ds)
-    if excel: save_to_excel(mcc_ds)
+    if netcdf and excel:
+        # The two files are independent, they are written at the same time
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(save_to_netcdf, mcc_ds), executor.submit(save_to_excel, mcc_ds)]
+        for future in futures:
+            future.result()  # raise the errors of the writers
+    elif netcdf: save_to_netcdf(mcc_ds)
+    elif excel: save_to_excel(mcc_ds)
 
 
 if __name__ == "__main__":
@@ -6,19 +6,15 @@
 # This module handles the visualization of correlation results between SWA and yield anomalies.
 # --------------------------------------------------------------
 import os
+from functools import lru_cache
 import pandas as pd
 import xarray as xr
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 from matplotlib.widgets import Slider
 import geopandas as gpd
+import shapely
 import numpy as np
-import holoviews as hv
-import geoviews as gv
-import panel as pn
-import param
-from IPython import get_ipython
-hv.extension('bokeh', 'matplotlib')
 # --------------------------------------------------------------
 
 config = None  # to be set from outside
@@ -32,25 +28,66 @@ config = None  # to be set from outside
 
 
 # ---------- DATA TREATMENT -----------------------------------------
-def load_correlation_results():
-    """Load the correlation results from the NetCDF file."""
-    if not os.path.exists(f"{config.corr_config.CORR_RESULTS_DIR}/mcc_results.nc"):
-        raise FileNotFoundError(f"Correlation results file not found: {f"{config.corr_config.CORR_RESULTS_DIR}/mcc_results.nc"}")
-    ds = xr.open_dataset(f"{config.corr_config.CORR_RESULTS_DIR}/mcc_results.nc")
-    return ds
+def load_correlation_results(engine=None):
+    """Load the correlation results from the NetCDF file.
+    The results (thresholds x regions) are small, so they are read in memory once and the file is closed:
+    the plots then select from memory instead of reading the file again for each map.
+    Args:
+        engine (str, optional): xarray backend used to read the file (e.g. "h5netcdf"). Defaults to xarray's choice.
+    Returns:
+        xarray.Dataset: The correlation results.
+    """
+    results_file = os.path.abspath(f"{config.corr_config.CORR_RESULTS_DIR}/mcc_results.nc")
+    if not os.path.exists(results_file):
+        raise FileNotFoundError(f"Correlation results file not found: {results_file}")
+    # The modification time is part of the cache key, so results computed again are read again
+    return _read_correlation_results(results_file, os.path.getmtime(results_file), engine)
+
+
+@lru_cache(maxsize=1)
+def _read_correlation_results(results_file, mtime, engine):
+    """Read the correlation results file, cached for repeated loads of the same file (e.g. in the interactive mode)."""
+    return xr.load_dataset(results_file, engine=engine)
 
 
 def read_shapefile():
-    """ Load the NUTS shapefile for mapping."""
+    """ Load the NUTS shapefile for mapping, indexed by NUTS_ID (the maps join on it).
+    The shapefile is read once and shared by all the maps (e.g. each slider update): it must not be modified.
+    """
     if not os.path.exists(config.paths.NUTS_SHAPEFILE):
         raise FileNotFoundError(f"Shapefile not found: {config.paths.NUTS_SHAPEFILE}")
-    gdf = gpd.read_file(config.paths.NUTS_SHAPEFILE)
-    return gdf
+    shapefile = os.path.abspath(config.paths.NUTS_SHAPEFILE)
+    return _read_shapefile(shapefile, os.path.getmtime(shapefile))
+
+
+@lru_cache(maxsize=1)
+def _read_shapefile(shapefile, mtime):
+    """Read the NUTS shapefile, cached for the same file (the modification time is part of the key)."""
+    gdf = gpd.read_file(shapefile, engine="pyogrio", columns=["NUTS_ID"])
+    return gdf.set_index("NUTS_ID")
+
+
+def bbox_subset(gdf, xlim, ylim):
+    """Features of a GeoDataFrame intersecting a bounding box (e.g. the extent of a map), in their original order.
+    The query uses the spatial index (STRtree) of the GeoDataFrame, built on first use and kept with it:
+    with the shared GeoDataFrame of read_shapefile, the index is built once for all the maps.
+    Args:
+        gdf (GeoDataFrame): The features.
+        xlim (tuple): (min, max) of the x coordinates of the box.
+        ylim (tuple): (min, max) of the y coordinates of the box.
+    Returns:
+        GeoDataFrame: The features intersecting the box.
+    """
+    positions = gdf.sindex.query(shapely.box(xlim[0], ylim[0], xlim[1], ylim[1]), predicate="intersects")
+    return gdf.iloc[np.sort(positions)]
 
 
 def associate_shp_data(gdf, data_df, data_col, shp_id_col='NUTS_ID', data_id_col='Region'):
-    """Associate data from a DataFrame to a GeoDataFrame based on region identifiers."""
-    gdf = gdf.set_index(shp_id_col).join(data_df.set_index(data_id_col))
+    """Associate data from a DataFrame to a GeoDataFrame based on region identifiers.
+    The GeoDataFrame can already be indexed by the identifiers (as returned by read_shapefile). A new GeoDataFrame is returned."""
+    if gdf.index.name != shp_id_col:
+        gdf = gdf.set_index(shp_id_col)
+    gdf = gdf.join(data_df.set_index(data_id_col))
     return gdf
 
 
@@ -84,13 +121,13 @@ def get_max_mcc_df(ds):
     Returns:
         pd.DataFrame: DataFrame with columns 'Region', 'Max_MCC', 'TH_SWA', 'TH_YA'.
     """
-    max_mcc_ds = ds['MCC'].max(dim=["TH_SWA", "TH_YA"])
     max_indices = ds['MCC'].argmax(dim=["TH_SWA", "TH_YA"])
+    max_mcc_ds = ds['MCC'].isel(max_indices)  # the maximum is read at its position, not computed again
 
-    TH_SWA_max, TH_YA_MAX = ds['TH_SWA'].values[max_indices["TH_SWA"].values], ds['TH_YA'].values[max_indices["TH_YA"].values]
+    # Thresholds at the maximum of each region, gathered at once
+    TH_SWA_max, TH_YA_max = ds['TH_SWA'].values[max_indices["TH_SWA"].values], ds['TH_YA'].values[max_indices["TH_YA"].values]
 
-    df_max_mcc = pd.DataFrame({'Region': max_mcc_ds['region'].values, 'Max_MCC': max_mcc_ds.values})
-    df_max_mcc['TH_SWA'], df_max_mcc['TH_YA'] = [ds['TH_SWA'].values[idx] for idx in max_indices["TH_SWA"]], [ds['TH_YA'].values[idx] for idx in max_indices["TH_YA"]]
+    df_max_mcc = pd.DataFrame({'Region': max_mcc_ds['region'].values, 'Max_MCC': max_mcc_ds.values, 'TH_SWA': TH_SWA_max, 'TH_YA': TH_YA_max})
     return df_max_mcc
 
 def get_max_mcc_shapefile(ds):
@@ -167,6 +204,13 @@ def plot_max_mcc_map(ds, save=False, show=False):
     )
     ax[1,0].axis('off')
 
+    # Annotations: the centroids are computed once for the three maps, and only the regions with a maximum MCC are annotated
+    annotated_columns = {(0,0): 'Max_MCC', (0,1): 'TH_SWA', (1,1): 'TH_YA'}
+    centroids = shapely.centroid(np.asarray(gdf.geometry.values))
+    centroids_x, centroids_y = shapely.get_x(centroids), shapely.get_y(centroids)
+    annotated = np.flatnonzero(gdf.geometry.notna().to_numpy() & gdf['Max_MCC'].notna().to_numpy())
+    annotation_bbox = {"boxstyle": "round, pad=0.2, rounding_size=0.5", "facecolor":"white", "ec":"black", "lw":0.2, "alpha":0.7}
+
     for (i,j) in [(0,0), (0,1), (1,1)]:
         ax[i,j].set_aspect('equal')
         if (i,j) == (0,0):
@@ -184,18 +228,10 @@ def plot_max_mcc_map(ds, save=False, show=False):
             fig.colorbar(cbar, ax=ax[i,j], orientation='horizontal', fraction=0.05, pad=0.05, aspect=50, shrink=0.7,
                          extend="min", ticks=ds['TH_YA'].values)
 
-        for idx, row in gdf.iterrows():
-            if row['geometry'] is not None and not np.isnan(row['Max_MCC']):
-                centroid = row['geometry'].centroid
-                if (i,j) == (0,0):
-                    ax[i,j].annotate(f"{row['Max_MCC']:.2f}", xy=(centroid.x, centroid.y),
-                                ha='center', va='center', fontsize=4, color="black", bbox={"boxstyle": "round, pad=0.2, rounding_size=0.5", "facecolor":"white", "ec":"black", "lw":0.2, "alpha":0.7}, zorder=5)
-                if (i,j) == (0,1):
-                    ax[i,j].annotate(f"{row['TH_SWA']:.2f}", xy=(centroid.x, centroid.y),
-                                    ha='center', va='center', fontsize=4, color="black", bbox={"boxstyle": "round, pad=0.2, rounding_size=0.5", "facecolor":"white", "ec":"black", "lw":0.2, "alpha":0.7}, zorder=5)
-                elif (i,j) == (1,1):
-                    ax[i,j].annotate(f"{row['TH_YA']:.2f}", xy=(centroid.x, centroid.y),
-                                    ha='center', va='center', fontsize=4, color="black", bbox={"boxstyle": "round, pad=0.2, rounding_size=0.5", "facecolor":"white", "ec":"black", "lw":0.2, "alpha":0.7}, zorder=5)
+        # Value of the map at the centroid of each region
+        for k in annotated:
+            ax[i,j].annotate(f"{gdf[annotated_columns[(i,j)]].iat[k]:.2f}", xy=(centroids_x[k], centroids_y[k]),
+                             ha='center', va='center', fontsize=4, color="black", bbox=annotation_bbox, zorder=5)
 
     plt.tight_layout()
 
@@ -219,15 +255,26 @@ def interactive_mcc_map(ds):
     th_swa_init = th_swa_vals[0]
     th_ya_init = th_ya_vals[0]
 
-    mcc_da = ds.sel(TH_SWA=th_swa_init, TH_YA=th_ya_init)['MCC']
-    df_mcc = pd.DataFrame({'Region': mcc_da['region'].values, 'MCC': mcc_da.values})
     gdf = read_shapefile()
-    mcc_gdf = associate_shp_data(gdf, df_mcc, 'MCC')
+    # Position in the results of the region of each polygon (-1 for the regions without results), computed once for all the updates
+    region_rows = pd.Index(ds['region'].values).get_indexer(gdf.index)
+    # The polygons are drawn once: geopandas draws one patch per part of the multipolygons, the updates only change their colors
+    parts = shapely.get_num_geometries(np.asarray(gdf.geometry.values))
+
+    def mcc_colors(th_swa, th_ya):
+        """MCC of each patch for the thresholds, masked for the regions without results."""
+        mcc_values = ds.sel(TH_SWA=th_swa, TH_YA=th_ya)['MCC'].values
+        mcc_regions = np.where(region_rows >= 0, mcc_values[region_rows], np.nan)
+        return np.ma.masked_invalid(np.repeat(mcc_regions, parts))
 
     fig, ax = plt.subplots(figsize=(10, 8))
     plt.subplots_adjust(left=0.25)
 
-    mcc_gdf.plot(column='MCC', ax=ax, legend=False, cmap='coolwarm', vmin=-1, vmax=1)
+    gdf.plot(ax=ax)
+    patches = ax.collections[-1]
+    patches.set_cmap(plt.get_cmap('coolwarm').with_extremes(bad=(0, 0, 0, 0)))  # regions without MCC are not shown
+    patches.set_clim(-1, 1)
+    patches.set_array(mcc_colors(th_swa_init, th_ya_init))
     ax.set_title(f'MCC Map (TH_SWA={th_swa_init:.2f}, TH_YA={th_ya_init:.2f})')
     ax.axis('off')
 
@@ -245,13 +292,8 @@ def interactive_mcc_map(ds):
     def update(val):
         th_swa = slider_swa.val
         th_ya = slider_ya.val
-        mcc_da = ds.sel(TH_SWA=th_swa, TH_YA=th_ya)['MCC']
-        df_mcc = pd.DataFrame({'Region': mcc_da['region'].values, 'MCC': mcc_da.values})
-        mcc_gdf_updated = associate_shp_data(gdf, df_mcc, 'MCC', shp_id_col="NUTS_ID", data_id_col="Region")
-        ax.clear()
-        mcc_gdf_updated.plot(column='MCC', ax=ax, legend=False, cmap='coolwarm', vmin=-1, vmax=1)
+        patches.set_array(mcc_colors(th_swa, th_ya))
         ax.set_title(f'MCC Map (TH_SWA={th_swa:.2f}, TH_YA={th_ya:.2f})')
-        ax.axis('off')
         fig.canvas.draw_idle()
 
     slider_swa.on_changed(update)
@@ -274,9 +316,25 @@ def holoviz_interactive_mcc(ds, mode=None):
     If mode is 'notebook', it will display in the Jupyter notebook.
     If mode is 'browser', it will open in a new browser tab.
     """
+    # Imported here so that the static maps do not load holoviews, bokeh and panel
+    import holoviews as hv
+    import geoviews as gv
+    import panel as pn
+    import param
+    from IPython import get_ipython
+    hv.extension('bokeh', 'matplotlib')
+
     th_swa_vals = [round(v, 2) for v in ds["TH_SWA"].values]
     th_ya_vals = list(ds["TH_YA"].values)
 
+    xlim, ylim = (-12, 42), (35, 72)  # extent of the map
+
+    # The polygons (with NUTS_ID as a column for the hover) and the position of their region in the results are prepared once,
+    # each view only sets the MCC values
+    polygons = bbox_subset(read_shapefile(), xlim, ylim).copy()  # only the regions in the extent of the map are sent to Bokeh
+    polygons['NUTS_ID'] = polygons.index
+    region_rows = pd.Index(ds['region'].values).get_indexer(polygons.index)
+
     class MCCMap(param.Parameterized):
         th_swa  = param.Selector(label="TH_SWA", objects=th_swa_vals, default=th_swa_vals[0])
         th_ya   = param.Selector(label="TH_YA", objects=th_ya_vals, default=th_ya_vals[0])
@@ -289,17 +347,9 @@ def holoviz_interactive_mcc(ds, mode=None):
             th_swa_raw = ds["TH_SWA"].values[idx_swa]
             th_ya_raw = self.th_ya
 
-            # Extraire MCC pour ce seuil
-            mcc_da = ds.sel(TH_SWA=th_swa_raw, TH_YA=th_ya_raw)['MCC']
-            df_mcc = pd.DataFrame({'NUTS_ID': mcc_da['region'].values, 'MCC': mcc_da.values})
-
-            # Lire shapefile + fusion
-            gdf = read_shapefile()  # doit contenir une colonne 'NUTS_ID'
-            gdf = associate_shp_data(gdf, df_mcc, 'MCC', shp_id_col="NUTS_ID", data_id_col="NUTS_ID")
-
-            # S'assurer que NUTS_ID existe bien
-            if 'NUTS_ID' not in gdf.columns:
-                gdf['NUTS_ID'] = gdf.index
+            # MCC for these thresholds, set on the prepared polygons
+            mcc_values = ds.sel(TH_SWA=th_swa_raw, TH_YA=th_ya_raw)['MCC'].values
+            gdf = polygons.assign(MCC=np.where(region_rows >= 0, mcc_values[region_rows], np.nan))
 
             # Palette
             import matplotlib.colors as mcolors
@@ -322,7 +372,7 @@ def holoviz_interactive_mcc(ds, mode=None):
                 cmap=truncated_cmap, color='MCC', tools=['hover', 'wheel_zoom'],
                 width=800, height=600, colorbar=True, clim=self.clim,
                 title=f'MCC Map | TH_SWA:{self.th_swa} - TH_YA:{th_ya_raw}',
-                xlim=(-12, 42), ylim=(35, 72),
+                xlim=xlim, ylim=ylim,
             )
             return gdf_hv
 
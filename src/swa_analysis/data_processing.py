@@ -8,15 +8,21 @@
 # --------------------------------------------------------------
 import numpy as np
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
 import rioxarray as rxr
 import geopandas as gpd
 import pandas as pd
-from rasterstats import zonal_stats
+import rasterio
+from rasterio import features
 import src.swa_analysis.visualization as visualization
 import src.utils as utils
 
 config = None  # Have to be set from outside before using the functions
 
+# Format of the spatial and temporal mean files: a single file each (no .shx/.dbf/.prj), without the column name limits of the shapefiles
+_VECTOR_DRIVER = "FlatGeobuf"
+
 
 # ---------- FUNCTIONS -----------------------------------------
 def open_raster(path, masked=True):
@@ -32,6 +38,28 @@ def open_raster(path, masked=True):
     raster = rxr.open_rasterio(path, masked=masked).sel(band=1).squeeze()
     return raster
 
+# Corine rasters reprojected on the SWA grids : {(Corine grid, SWA grid): DataArray}
+# The SWA rasters of all the dates share the same grid, so the warp is done once
+_CORINE_ON_GRID = {}
+_CORINE_ON_GRID_SIZE = 4
+
+
+def _corine_on_grid(corine, swa):
+    """Corine weights (first band, from 0 to 1) on the grid of the SWA raster, reprojected once per grid.
+    Args:
+        corine (xarray.DataArray): Corine Land Cover raster data.
+        swa (xarray.DataArray): SWA raster data giving the grid.
+    Returns:
+        xarray.DataArray: The Corine weights on the SWA grid.
+    """
+    key = tuple((raster.rio.transform(), raster.rio.shape, raster.rio.crs) for raster in (corine, swa))
+    if key not in _CORINE_ON_GRID:
+        if len(_CORINE_ON_GRID) >= _CORINE_ON_GRID_SIZE:
+            del _CORINE_ON_GRID[next(iter(_CORINE_ON_GRID))]  # oldest grid
+        _CORINE_ON_GRID[key] = corine.rio.reproject_match(swa).sel(band=1).drop_vars(["band", "spatial_ref"])/255.0
+    return _CORINE_ON_GRID[key]
+
+
 def process_swa(swa, corine, threshold, save=False, show=False, date=False):
     """Process SWA data with Corine Land Cover data.
     Here the SWA raster is filtered by a threshold and weighted by the Corine raster.
@@ -45,11 +73,14 @@ def process_swa(swa, corine, threshold, save=False, show=False, date=False):
     Returns:
         swa_drought_corine (xarray.DataArray): Processed SWA data weighted by Corine Land Cover data.
     """
-    swa = swa.rio.clip_box(minx=corine.rio.bounds()[0],miny=corine.rio.bounds()[1],maxx=corine.rio.bounds()[2],maxy=corine.rio.bounds()[3]).drop_vars(["band"])
-    corine = corine.rio.reproject_match(swa).sel(band=1).drop_vars(["band", "spatial_ref"])/255.0
+    corine_bounds = corine.rio.bounds()
+    if swa.rio.bounds() != corine_bounds:
+        swa = swa.rio.clip_box(minx=corine_bounds[0], miny=corine_bounds[1], maxx=corine_bounds[2], maxy=corine_bounds[3])
+    swa = swa.drop_vars(["band"])
+    corine = _corine_on_grid(corine, swa)
 
     swa_filtered = swa.where(swa < threshold, other=np.nan)
-    swa_binary = swa_filtered.notnull().astype(int)
+    swa_binary = swa_filtered.notnull().astype(np.int8)  # int8 x float32 Corine weights stays float32
     swa_drought_corine = swa_binary * corine
 
     if save:
@@ -65,34 +96,87 @@ def process_swa(swa, corine, threshold, save=False, show=False, date=False):
 
 
 
-def spatial_mean_shp(raster_path, shapefile, date="", save=False, show=False, **kwargs):
+# Label rasters of the NUTS geometries on the SWA grids : {(geometries key, transform, shape): np.ndarray}
+# The NUTS and the grid are the same for all the dates, so the geometries are rasterized once
+_LABELS = {}
+_LABELS_SIZE = 4
+
+
+def _label_raster(gdf, transform, shape):
+    """Label raster of the geometries: index of the geometry covering each pixel (pixel center inside), -1 outside of all the geometries."""
+    shapes = ((geom, i) for i, geom in enumerate(gdf.geometry) if geom is not None and not geom.is_empty)
+    return features.rasterize(shapes, out_shape=shape, transform=transform, fill=-1, dtype="int32")
+
+
+def zonal_mean(raster, gdf, cache_key=None):
+    """Mean of the raster pixels in each geometry, for all the geometries in one pass over the raster.
+    As rasterstats' zonal_stats(stats="mean", nodata=np.nan): a pixel belongs to a geometry if its center is inside,
+    NaN pixels are ignored, and the mean of a geometry without valid pixels is NaN.
+    Args:
+        raster (str or xarray.DataArray, required): Path to the raster file (first band used) or the 2D raster data.
+        gdf (GeoDataFrame, required): Geometries, in the coordinate system of the raster. They are not expected to overlap.
+        cache_key (hashable, optional): Identifies the geometries (e.g. path and modification time of their file).
+                                        If given, their label raster is kept for the next calls on the same grid. Defaults to None.
+    Returns:
+        np.ndarray: The mean of each geometry, in the order of the GeoDataFrame.
+    """
+    if isinstance(raster, str):
+        with rasterio.open(raster) as src:
+            data, transform = src.read(1).astype(float), src.transform
+    else:
+        data, transform = np.asarray(raster.values, dtype=float), raster.rio.transform()
+
+    if cache_key is None:
+        labels = _label_raster(gdf, transform, data.shape)
+    else:
+        key = (cache_key, transform, data.shape)
+        if key not in _LABELS:
+            if len(_LABELS) >= _LABELS_SIZE:
+                del _LABELS[next(iter(_LABELS))]  # oldest grid
+            _LABELS[key] = _label_raster(gdf, transform, data.shape)
+        labels = _LABELS[key]
+
+    valid = (labels >= 0) & ~np.isnan(data)
+    sums = np.bincount(labels[valid], weights=data[valid], minlength=len(gdf))
+    counts = np.bincount(labels[valid], minlength=len(gdf))
+    means = np.full(len(gdf), np.nan)
+    np.divide(sums, counts, out=means, where=counts > 0)
+    return means
+
+
+@lru_cache(maxsize=1)
+def _read_shapefile(shapefile, mtime):
+    """Read a shapefile, cached for the same file (the modification time is part of the key): the result must not be modified."""
+    return gpd.read_file(shapefile)
+
+
+def spatial_mean_shp(raster, shapefile, date="", save=False, show=False, **kwargs):
     """Transform a raster file into a shapefile with the mean values of the raster for each regions in the shapefile.
     Args:
-        raster_path (strn required): Path to the raster file containing SWA data.
+        raster (str or xarray.DataArray, required): Path to the raster file containing SWA data, or the raster data itself (e.g. from process_swa).
         nuts_shapefile (str, required): Path to the NUTS shapefile to use for aggregation.
         save (bool, optional): If True, save the aggregated raster. Defaults to False.
     Returns:
         NUTS_swa (GeoDataFrame): A GeoDataFrame containing the aggregated SWA mean values for each NUTS region.
     """
-    # Open the NUTS shapefile if it's a path, otherwise use the GeoDataFrame directly
+    # Open the NUTS shapefile if it's a path (read and rasterized once for all the dates), otherwise use the GeoDataFrame directly
     if isinstance(shapefile, str):
-        spatial_mean_shp = gpd.read_file(shapefile)
+        shapefile_key = (os.path.abspath(shapefile), os.path.getmtime(shapefile))
+        spatial_mean_shp = _read_shapefile(*shapefile_key).copy()
     else:
+        shapefile_key = None
         spatial_mean_shp = shapefile.copy()
 
-    # Perform zonal statistics to calculate the mean SWA for each NUTS region
-    stats = zonal_stats(spatial_mean_shp, raster_path, stats="mean", nodata=np.nan, geojson_out=True)
-
-    # Convert the zonal statistics results to a GeoDataFrame
-    spatial_mean_shp["mean"] = [feature["properties"]["mean"] for feature in stats]
+    # Mean SWA for each NUTS region
+    spatial_mean_shp["mean"] = zonal_mean(raster, spatial_mean_shp, cache_key=shapefile_key)
     spatial_mean_shp = spatial_mean_shp.drop(columns=["NAME_LATN", "NUTS_NAME", "MOUNT_TYPE", "URBN_TYPE", "COAST_TYPE"], errors="ignore")
 
     # Save the aggregated raster if requested
     if save:
-        output_path = f"{config.swa_config.SWA_SPATIAL_MEAN_DIR}/spatial_mean_swa_{date}.shp"
+        output_path = f"{config.swa_config.SWA_SPATIAL_MEAN_DIR}/spatial_mean_swa_{date}.fgb"
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         if not os.path.exists(output_path):
-            spatial_mean_shp.to_file(output_path, driver="ESRI Shapefile")
+            spatial_mean_shp.to_file(output_path, driver=_VECTOR_DRIVER)
 
     if show:
         visualization.plot_shapefile(spatial_mean_shp, column="mean", title="Spatial Mean SWA by NUTS Regions", date=date, show=True, boundaries="europe" ,threshold=kwargs.get("threshold", "#N/A"))
@@ -101,6 +185,23 @@ def spatial_mean_shp(raster_path, shapefile, date="", save=False, show=False, **
 
 
 
+def _means_matrix(list_means, nuts_ids):
+    """Stack the "mean" columns of several files (e.g. one per date) into a matrix, aligned on the regions.
+    Args:
+        list_means (list, required): DataFrames with the columns "NUTS_ID" and "mean".
+        nuts_ids (array-like, required): The regions, in the order of the columns of the matrix.
+    Returns:
+        np.ndarray: Matrix (files x regions) of the means, NaN for the regions missing in a file.
+    """
+    nuts_ids = pd.Index(nuts_ids)
+    matrix = np.full((len(list_means), len(nuts_ids)), np.nan)
+    for row, means in zip(matrix, list_means):
+        positions = nuts_ids.get_indexer(means["NUTS_ID"])
+        found = positions >= 0
+        row[positions[found]] = means["mean"].to_numpy()[found]
+    return matrix
+
+
 def temporal_mean_shp(list_dates, save=False, show=False, save_plot=False, **kwargs):
     """Calculate the temporal mean of the processed shapefile for a given period.
     Args:
@@ -114,19 +215,19 @@ def temporal_mean_shp(list_dates, save=False, show=False, save_plot=False, **kwa
     """
     spatial_mean_shp_list = []
     for date in list_dates:
-        shapefile_path = f"{config.swa_config.SWA_SPATIAL_MEAN_DIR}/spatial_mean_swa_{date}.shp"
+        shapefile_path = f"{config.swa_config.SWA_SPATIAL_MEAN_DIR}/spatial_mean_swa_{date}.fgb"
         if os.path.exists(shapefile_path):
-            spatial_mean_gdf = gpd.read_file(shapefile_path)
+            # Only the columns used are read, and the geometries only once (from the first date)
+            spatial_mean_gdf = gpd.read_file(shapefile_path, engine="pyogrio", columns=["NUTS_ID", "mean"], read_geometry=not spatial_mean_shp_list)
             spatial_mean_shp_list.append(spatial_mean_gdf)
         else:
             raise FileNotFoundError(f"Shapefile for date {date} not found at {shapefile_path}. Please ensure the shapefile exists or create it using spatial_mean_shp function.")
 
-    # Concatenate the GeoDataFrames
-    NUTS_period = pd.concat([gdf[["NUTS_ID", "mean"]].assign(date=date) for gdf, date in zip(spatial_mean_shp_list, list_dates)], ignore_index=True)
-    # Calculate the temporal mean for each NUTS over the period
-    NUTS_mean = NUTS_period.groupby("NUTS_ID")["mean"].mean().reset_index()
-    # Merge the mean values back to the NUTS shapefile
-    NUTS_swa_period = spatial_mean_shp_list[0][["NUTS_ID", "geometry"]].merge(NUTS_mean, on="NUTS_ID")
+    # Calculate the temporal mean for each NUTS over the period (NaN values ignored), on the regions of the first date
+    NUTS_swa_period = spatial_mean_shp_list[0][["NUTS_ID", "geometry"]].copy()
+    means = _means_matrix(spatial_mean_shp_list, NUTS_swa_period["NUTS_ID"])
+    valid = ~np.isnan(means)
+    NUTS_swa_period["mean"] = np.divide(np.where(valid, means, 0).sum(axis=0), valid.sum(axis=0), out=np.full(means.shape[1], np.nan), where=valid.any(axis=0))
 
     year = list_dates[0].split("-")[0]
     month_start = int(list_dates[0].split("-")[1])
@@ -134,9 +235,9 @@ def temporal_mean_shp(list_dates, save=False, show=False, save_plot=False, **kwa
 
 
     if save:
-        output_path = f"{config.swa_config.SWA_TEMPORAL_MEAN_DIR}/temporal_mean_swa-{year}-{utils.get_month_str(month_start)}_{utils.get_month_str(month_end)}.shp"
+        output_path = f"{config.swa_config.SWA_TEMPORAL_MEAN_DIR}/temporal_mean_swa-{year}-{utils.get_month_str(month_start)}_{utils.get_month_str(month_end)}.fgb"
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        NUTS_swa_period.to_file(output_path, driver="ESRI Shapefile")
+        NUTS_swa_period.to_file(output_path, driver=_VECTOR_DRIVER)
 
     if show:
         visualization.plot_shapefile(NUTS_swa_period, column="mean", title="Temporal Mean SWA by NUTS Regions", date=f"{list_dates[0]} - {list_dates[-1]}", show=True, boundaries="europe", threshold=kwargs.get("threshold", "#N/A"))
@@ -161,16 +262,19 @@ def temporal_series_region(year_start=None, year_end=None, month_start=None, mon
     def check_temporal_mean_shp_available(list_years):
         """Check if the temporal mean shapefile for a year already exist, if not, it creates the shapefile"""
         for year in list_years:
-            if not os.path.exists(f"{config.swa_config.SWA_TEMPORAL_MEAN_DIR}/temporal_mean_swa-{year}-{month_start_str}_{month_end_str}.shp"):
+            if not os.path.exists(f"{config.swa_config.SWA_TEMPORAL_MEAN_DIR}/temporal_mean_swa-{year}-{month_start_str}_{month_end_str}.fgb"):
                 raise FileNotFoundError(f"Temporal mean shapefile for year {year} not found. Please create it using temporal_mean_shp function.")
 
     check_temporal_mean_shp_available(list_years)
 
-    list_shapefiles = {year : f"{config.swa_config.SWA_TEMPORAL_MEAN_DIR}/temporal_mean_swa-{year}-{month_start_str}_{month_end_str}.shp" for year in list_years}
+    list_shapefiles = {year : f"{config.swa_config.SWA_TEMPORAL_MEAN_DIR}/temporal_mean_swa-{year}-{month_start_str}_{month_end_str}.fgb" for year in list_years}
     
-    merged_gdf = pd.concat([gpd.read_file(list_shapefiles[year]).assign(year=year)[["NUTS_ID", "year", "mean"]] for year in list_years], ignore_index=True)
+    # Only the attributes are needed for the series, the geometries are not read
+    list_means = [gpd.read_file(list_shapefiles[year], engine="pyogrio", columns=["NUTS_ID", "mean"], read_geometry=False) for year in list_years]
 
-    temporal_series = merged_gdf.pivot(index="year", columns="NUTS_ID", values="mean")
+    # Series (years x NUTS), on all the regions in alphabetical order
+    nuts_ids = pd.Index(np.unique(np.concatenate([means["NUTS_ID"].to_numpy() for means in list_means])), name="NUTS_ID")
+    temporal_series = pd.DataFrame(_means_matrix(list_means, nuts_ids), index=pd.Index(list_years, name="year"), columns=nuts_ids)
 
     if save:
         output_path = f"{config.swa_config.SWA_TEMPORAL_SERIES_DIR}/temporal_series_swa-{year_start}_{year_end}-{month_start_str}_{month_end_str}.xlsx"
@@ -184,7 +288,45 @@ def temporal_series_region(year_start=None, year_end=None, month_start=None, mon
 
 
 # ---------- SCRIPTS -------------------------------------------
-def run_swa(threshold, year_start=None, year_end=None, month_start=None, month_end=None):
+@lru_cache(maxsize=1)
+def _open_corine(path):
+    """Corine Land Cover raster, opened once per process for all the dates."""
+    return rxr.open_rasterio(path, masked=True).squeeze()
+
+
+def _init_worker(worker_config, corine_on_grid, labels):
+    """Set the configuration of the module in a worker process of run_swa, with the Corine and label rasters of the parent process."""
+    global config
+    config = worker_config
+    _CORINE_ON_GRID.update(corine_on_grid)
+    _LABELS.update(labels)
+
+
+def _process_date(year, month, threshold):
+    """Process the SWA raster of a date into its spatial mean shapefile (see run_swa).
+    Args:
+        year (int, required): Year of the date.
+        month (int, required): Month of the date.
+        threshold (float, required): Threshold value to filter the SWA data.
+    """
+    date = utils.date(year, month)
+
+    swa_path = f"{config.swa_config.SWA_ANOM_DIR}/swa_{utils.date(year, month, multplier_month=3)}.tif"
+    swa = rxr.open_rasterio(swa_path, masked=True).squeeze()
+
+    corine = _open_corine(config.paths.CORINE_TIF)
+
+    # The processed raster is aggregated in memory, without writing it
+    processed_swa = process_swa(swa, corine, threshold, date=date)
+
+    spatial_mean_shp(processed_swa, config.paths.NUTS_SHAPEFILE, date=date, save=True, threshold=threshold)
+
+
+# Default maximum number of processes of run_swa, each one holds a copy of the Corine raster on the SWA grid
+DEFAULT_MAX_WORKERS = 4
+
+
+def run_swa(threshold, year_start=None, year_end=None, month_start=None, month_end=None, max_workers=DEFAULT_MAX_WORKERS):
     """Run SWA drought analysis for a given date or period.
     Args:
         threshold (float, required): Threshold value to filter the SWA data.
@@ -192,36 +334,40 @@ def run_swa(threshold, year_start=None, year_end=None, month_start=None, month_e
         date_start (str, optional): Start date in 'YYYY-MM' format for a period. Defaults to None.
         date_end (str, optional): End date in 'YYYY-MM' format for a period. Defaults to None.
         period (str, optional): Period to process. Defaults to None.
+        max_workers (int, optional): Maximum number of dates processed in parallel processes, 1 to process them in this process.
+                                     Defaults to DEFAULT_MAX_WORKERS.
     Returns:
         None: Runs the analysis and saves the results. 
     """
     list_years = list(range(year_start, year_end + 1)) if year_start and year_end else [year_start]
     list_months = list(range(month_start, month_end + 1)) if month_start and month_end else [month_start]
 
-    progress_total = len(list_years) * len(list_months)
-    progress_count = 0
-
-    for year in list_years:
-        for month in list_months:
-            date = utils.date(year, month)
+    list_dates = [(year, month) for year in list_years for month in list_months]
 
-            swa_path = f"{config.swa_config.SWA_ANOM_DIR}/swa_{utils.date(year, month, multplier_month=3)}.tif"
-            swa = rxr.open_rasterio(swa_path, masked=True).squeeze()
+    if max_workers < 1:
+        raise ValueError(f"Invalid number of workers: {max_workers}. It must be at least 1")
 
-            corine = rxr.open_rasterio(config.paths.CORINE_TIF, masked=True).squeeze()
-
-            processed_swa = process_swa(swa, corine, threshold, date=date, save=True)
-
-            spatial_mean = spatial_mean_shp(f"{config.swa_config.SWA_PROCESSED_DIR}/swa_processed_corine_{date}.tif", config.paths.NUTS_SHAPEFILE, date=date, save=True, threshold=threshold)
-
-            # Remove the processed raster to save space
-            remove_processed_path = f"{config.swa_config.SWA_PROCESSED_DIR}/swa_processed_corine_{date}.tif"
-            if os.path.exists(remove_processed_path):
-                os.remove(remove_processed_path)      
-
-            progress_count += 1/(len(list_years)*len(list_months))*100
-            utils.progress_bar(progress_count, 100, prefix=f"Processing date {year}-{month} | Overall Progress:", suffix="Complete", bar_length=50)
+    # The dates are independent, so they are processed in parallel processes; the temporal aggregations wait for all of them
+    workers = min(len(list_dates) - 1, max_workers, os.cpu_count() or 1)
+    if workers < 2:
+        for progress_count, (year, month) in enumerate(list_dates, start=1):
+            _process_date(year, month, threshold)
+            utils.progress_bar(progress_count, len(list_dates), prefix=f"Processing date {year}-{month} | Overall Progress:", suffix="Complete", bar_length=50)
+    else:
+        # The first date is processed here, so that the Corine raster is reprojected and the NUTS rasterized once,
+        # then given to the workers, which do not load the full Corine raster
+        year, month = list_dates[0]
+        _process_date(year, month, threshold)
+        _open_corine.cache_clear()
+        utils.progress_bar(1, len(list_dates), prefix=f"Processing date {year}-{month} | Overall Progress:", suffix="Complete", bar_length=50)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config, _CORINE_ON_GRID, _LABELS)) as executor:
+            futures = {executor.submit(_process_date, year, month, threshold): (year, month) for year, month in list_dates[1:]}
+            for progress_count, future in enumerate(as_completed(futures), start=2):
+                future.result()  # raises the errors of the workers
+                year, month = futures[future]
+                utils.progress_bar(progress_count, len(list_dates), prefix=f"Processing date {year}-{month} | Overall Progress:", suffix="Complete", bar_length=50)
 
+    for year in list_years:
         list_dates_year = [utils.date(year, month) for month in list_months]
         temporal_mean_shp(list_dates_year, save=True, save_plot=True, threshold=threshold)
 
@@ -232,5 +378,5 @@ def run_swa(threshold, year_start=None, year_end=None, month_start=None, month_e
 if __name__ == "__main__":
     from src.config import Config
     config = Config()
-    run_swa(config.th_detection_drought, year_start=config.start_year, year_end=config.end_year, month_start=config.month_start, month_end=config.month_end
+    run_swa(config.th_detection_drought, year_start=config.year_start, year_end=config.year_end, month_start=config.month_start, month_end=config.month_end
     )
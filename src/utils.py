@@ -5,7 +5,10 @@
 # Description :
 # Utility functions, more or less utile.
 # --------------------------------------------------------------
+import argparse
 import datetime as dt
+from functools import lru_cache
+import numpy as np
 
 def aggregate_regions_shp():
     """Create a new shapefile with aggregated regions based on the provided mapping.
@@ -24,6 +27,7 @@ def date(year, month, multplier_month=1):
     """
     return f"{year}-{multplier_month*month:02d}"
 
+@lru_cache(maxsize=None)  # 12 months, formatted once
 def get_month_str(month):
     """Get the abbreviated month name (e.g., "JAN", "FEB").
     Args:
@@ -33,6 +37,7 @@ def get_month_str(month):
     """
     return dt.date(1900, month, 1).strftime("%b").upper()
 
+@lru_cache(maxsize=None)
 def get_period_aggregation_str(month_start, month_end):
     """Get a string representing the period aggregation (e.g. "6_months-APR_SEP").
     Used for naming files and directories.
@@ -45,6 +50,47 @@ def get_period_aggregation_str(month_start, month_end):
     return f"{month_end-month_start+1}_months-{get_month_str(month_start)}_{get_month_str(month_end)}"
 
 
+def parse_thresholds(spec):
+    """Parse a list of thresholds given on the command line, used as argparse type.
+    Args:
+        spec (str): Comma-separated thresholds (e.g. "0,-0.5,-1") or a range "(start,end,step)".
+    Returns:
+        list or tuple: The thresholds as a list, or the (start, end, step) tuple of a range, expanded by Config.
+    Raises:
+        argparse.ArgumentTypeError: If the thresholds are not numbers, reported by argparse as a usage error.
+    """
+    spec = spec.strip()
+    is_range = spec.startswith("(") and spec.endswith(")")
+    try:
+        values = np.array(spec.strip("()").split(","), dtype=float).tolist()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"thresholds must be comma-separated numbers or '(start,end,step)', got '{spec}'")
+    if is_range:
+        if len(values) != 3:
+            raise argparse.ArgumentTypeError(f"a range of thresholds must be '(start,end,step)', got '{spec}'")
+        return tuple(values)
+    return values
+
+
+def add_general_arguments(group, cfg=None):
+    """Add the general options shared by the SWA and correlation modules (drought threshold and period).
+    Args:
+        group (argparse.ArgumentParser or argument group): Where the options are added.
+        cfg (Config, optional): Configuration used for the default values. If None, options not given
+                                are absent from the parsed arguments, and Config.from_args uses its defaults.
+    """
+    def default(name):
+        return argparse.SUPPRESS if cfg is None else getattr(cfg, name)
+    group.add_argument("--th_detection_drought", "--threshold", "-th", type=float, default=default("th_detection_drought"), help="Threshold for drought detection")
+    group.add_argument("--year_start", "--start_year", type=int, default=default("year_start"), help="Start year")
+    group.add_argument("--year_end", "--end_year", type=int, default=default("year_end"), help="End year")
+    group.add_argument("--month_start", type=int, default=default("month_start"), help="Start month")
+    group.add_argument("--month_end", type=int, default=default("month_end"), help="End month")
+
+
+# Progress bars are not shown when False (e.g. in worker processes, whose bars would be mixed on the same terminal)
+show_progress = True
+
 
 def progress_bar(current, total, prefix="", suffix="", bar_length=40):
     """Display a progress bar in the console.
@@ -53,6 +99,8 @@ def progress_bar(current, total, prefix="", suffix="", bar_length=40):
         total (int): Total value for completion.
         bar_length (int): Length of the progress bar.
     """
+    if not show_progress:
+        return
     fraction = current / total
     arrow = int(fraction * bar_length - 1) * "=" + ">"
     if current == total:
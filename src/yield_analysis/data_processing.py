@@ -15,35 +15,17 @@ from src.config import config
 
 
 
-def get_prod_anom(region, return_data=False, return_years=False, return_meta=False, save=False)-> dict:
-    """
-    Prepares the data for the specified region by reading production and area data.
+def compute_prod_anom(prod, area):
+    """Compute the normalized yield anomalies of each site from its production and area series.
+    Only arrays are used (no configuration or files), so it can be called on any data.
     Args:
-        region (str): The region for which to prepare the data.
-        return_years (bool): If True, also return the years array.
-        return_meta (bool): If True, also return name, iso_3166_2, code arrays.
+        prod (np.ndarray): Production, shape (years, sites).
+        area (np.ndarray): Harvested area, shape (years, sites).
     Returns:
-        np.ndarray: Array containing production anomalies.
-        np.ndarray (optional): Array of years, if return_years is True.
-        tuple (optional): name, iso_3166_2, code arrays, if return_meta is True.
+        np.ndarray: Normalized yield anomalies, NaN for the sites with too many missing years.
+        np.ndarray: Yield (production / area).
+        np.ndarray: Filtered yield (trend).
     """
-    if region not in config.yield_config.REGIONS and region != "europe":
-        raise ValueError(f"Region '{region}' is not defined in config.yield_config.REGIONS.")
-
-    file_prod = f"{config.yield_config.DATA_STANDARDIZED_DIR}/{region}/prod_{region}_standardized.xlsx"
-    file_area = f"{config.yield_config.DATA_STANDARDIZED_DIR}/{region}/area_{region}_standardized.xlsx"
-    
-    data_prod = pd.read_excel(file_prod, header=None, index_col=0)
-    data_area = pd.read_excel(file_area, header=None, index_col=0)
-
-    name = data_prod.iloc[0,].values.astype(str)
-    iso_3166_2 = data_prod.iloc[1,].values
-    code = data_prod.iloc[2,].values.astype(str)
-    years = data_prod.index.values[3:].astype(int)
-
-    prod = data_prod.iloc[3:,0:].values.astype(float)
-    area = data_area.iloc[3:,0:].values.astype(float)
-
     n_site = prod.shape[1]
     prod_anom = np.full(prod.shape, np.nan)
 
@@ -77,6 +59,41 @@ def get_prod_anom(region, return_data=False, return_years=False, return_meta=Fal
 
             prod_anom[:, pos] = (data_sub2-np.nanmean(data_sub2))/np.nanstd(data_sub2)
 
+    return prod_anom, data_sub_df, filt_sub_df
+
+
+
+def get_prod_anom(region, return_data=False, return_years=False, return_meta=False, save=False)-> dict:
+    """
+    Prepares the data for the specified region by reading production and area data.
+    Args:
+        region (str): The region for which to prepare the data.
+        return_years (bool): If True, also return the years array.
+        return_meta (bool): If True, also return name, iso_3166_2, code arrays.
+    Returns:
+        np.ndarray: Array containing production anomalies.
+        np.ndarray (optional): Array of years, if return_years is True.
+        tuple (optional): name, iso_3166_2, code arrays, if return_meta is True.
+    """
+    if region not in config.yield_config.REGIONS and region != "europe":
+        raise ValueError(f"Region '{region}' is not defined in config.yield_config.REGIONS.")
+
+    file_prod = f"{config.yield_config.DATA_STANDARDIZED_DIR}/{region}/prod_{region}_standardized.xlsx"
+    file_area = f"{config.yield_config.DATA_STANDARDIZED_DIR}/{region}/area_{region}_standardized.xlsx"
+    
+    data_prod = pd.read_excel(file_prod, header=None, index_col=0)
+    data_area = pd.read_excel(file_area, header=None, index_col=0)
+
+    name = data_prod.iloc[0,].values.astype(str)
+    iso_3166_2 = data_prod.iloc[1,].values
+    code = data_prod.iloc[2,].values.astype(str)
+    years = data_prod.index.values[3:].astype(int)
+
+    prod = data_prod.iloc[3:,0:].values.astype(float)
+    area = data_area.iloc[3:,0:].values.astype(float)
+
+    prod_anom, data_sub_df, filt_sub_df = compute_prod_anom(prod, area)
+
     prod_anom = pd.DataFrame(prod_anom, columns=iso_3166_2 if region!="europe" else code, index=years)
     prod_anom.index.name = "year"
     prod_anom.columns.name = "id"
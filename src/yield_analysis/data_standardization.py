@@ -28,11 +28,11 @@ def copy_european_data():
                 shutil.copy(src_file, dest_file)
 
 
-def standardize_data(total_region=False):
+def standardize_data(total_region=False, regions=None):
     """
     Standardizes agricultural production data for a given region and year
     Args:
-    - regions : list, a list of regions to standardize data for (e.g., ["usa", "china", "india", "canada", "argentina", "brazil"])
+    - regions : list, a list of regions to standardize data for (e.g., ["usa", "china", "india", "canada", "argentina", "brazil"]), config.regions_to_standardize if None
     - years: list, a list of years for which to standardize data (e.g., [1991, 2023])
     - total_region: bool, whether to include total data for the region (default is False)
     Returns:
@@ -40,7 +40,7 @@ def standardize_data(total_region=False):
     """
     dfs = {}
 
-    for region in config.regions_to_standardize:
+    for region in (config.regions_to_standardize if regions is None else regions):
         # Ensure the region is valid
         valid_regions = ["usa", "china", "india", "canada", "argentina", "brazil"]
         if region not in valid_regions:
@@ -279,6 +279,18 @@ def standardize_data(total_region=False):
     ##### End of Data Standardization #####
 
 
+def iter_standardized_data(total_region=False):
+    """
+    Standardizes the data one region at a time, so that only one region is held in memory when saving.
+    Args:
+    - total_region: bool, whether to include total data for the region (default is False)
+    Returns:
+    - generator of (str, dict), each region of config.regions_to_standardize and its standardize_data dictionary
+    """
+    for region in config.regions_to_standardize:
+        yield region, standardize_data(total_region, regions=[region])
+
+
 def save_data(dfs):
     """
     Saves the standardized data to Excel files in the specified format.
@@ -9,7 +9,9 @@ import matplotlib.pyplot as plt
 import matplotlib as mpl
 from matplotlib.patches import Patch
 import cartopy.crs as ccrs
+import io
 import os
+from concurrent.futures import ThreadPoolExecutor
 import geopandas as gpd
 import numpy as np
 import pandas as pd
@@ -19,6 +21,38 @@ from src.config import config
 import src.utils as utils
 
 
+# ----- SAVING -----
+# Figures are rendered in the calling thread (matplotlib is not thread-safe), and the files are written
+# in background threads while the next figure is drawn
+_writer = None
+_writer_pid = None
+_pending_writes = []
+
+def _write_file(filepath, content):
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, "wb") as f:
+        f.write(content)
+
+def save_figure(fig, filepath, **kwargs):
+    """Save a figure: render it now and write the file in the background. Use wait_saved_figures to wait for the files.
+    Args:
+        fig (matplotlib.figure.Figure): The figure to save.
+        filepath (str): Path of the file, its extension gives the format.
+        **kwargs: Other arguments of Figure.savefig (dpi, bbox_inches, etc.).
+    """
+    global _writer, _writer_pid
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=os.path.splitext(filepath)[1][1:] or "png", **kwargs)
+    if _writer is None or _writer_pid != os.getpid():  # threads are not inherited by worker processes
+        _writer, _writer_pid = ThreadPoolExecutor(max_workers=4), os.getpid()
+        _pending_writes.clear()
+    _pending_writes.append(_writer.submit(_write_file, filepath, buffer.getvalue()))
+
+def wait_saved_figures():
+    """Wait until the figures given to save_figure are written, raising the errors of the writes."""
+    while _pending_writes:
+        _pending_writes.pop(0).result()
+
 
 
 def plot_anomaly_series(region, type, save=False, show=False):
@@ -56,8 +90,7 @@ def plot_anomaly_series(region, type, save=False, show=False):
                 if region=="europe":
                     id[pos] = code[pos]
                 filepath = f"{config.yield_config.FIGURES_DIR}/{region}/anomaly_series_filtered/anomaly_series-{id[pos]}.png"
-                os.makedirs(os.path.dirname(filepath), exist_ok=True)
-                plt.savefig(filepath, dpi=300)
+                save_figure(plt.gcf(), filepath, dpi=300)
             
             if show:
                 plt.show()
@@ -79,13 +112,13 @@ def plot_anomaly_series(region, type, save=False, show=False):
                 if region=="europe":
                     id[pos] = code[pos]
                 filepath = f"{config.yield_config.FIGURES_DIR}/{region}/anomaly_series_normalized/normalized_anomaly_series-{id[pos]}.png"
-                os.makedirs(os.path.dirname(filepath), exist_ok=True)
-                plt.savefig(filepath, dpi=300)
+                save_figure(plt.gcf(), filepath, dpi=300)
             if show:
                 plt.show()
         progress_bar_step += 1
         utils.progress_bar(progress_bar_step, n_sites, prefix=f"Progress for {region}", suffix=f"Completed for site {name[pos]} ({id[pos]})       ")
         plt.close()
+    wait_saved_figures()
         
 
 
@@ -198,8 +231,7 @@ def plot_anomaly_map(region, anomaly="neg", sel_years=None, save=False, show=Fal
             elif isinstance(region, list):
                 region_name = "-".join(region)
                 filepath = f"{config.yield_config.FIGURES_DIR}/mult_regions/anomaly_map/{region_name}-{anomaly}_anomaly_map-{year}.png"
-            os.makedirs(os.path.dirname(filepath), exist_ok=True)
-            plt.savefig(filepath, dpi=300)
+            save_figure(plt.gcf(), filepath, dpi=300)
         if show:
             plt.show()
 
@@ -207,6 +239,7 @@ def plot_anomaly_map(region, anomaly="neg", sel_years=None, save=False, show=Fal
         utils.progress_bar(progress_bar_step, len(years), prefix=f"Progress for {region}", suffix=f"| Completed for year {year}       ")
 
         plt.close()
+    wait_saved_figures()
  
 
 
@@ -403,11 +436,11 @@ def plot_area_covered(region, data, save=False, show=False, thresh_min=-2.5, thr
     ax.set_title(full_title, fontsize=16, loc="center")
     
     if save:
-        os.makedirs(dir_fig, exist_ok=True)
-        plt.savefig(figname, dpi=300, bbox_inches="tight", pad_inches=0.1)
+        save_figure(fig, figname, dpi=300, bbox_inches="tight", pad_inches=0.1)
         plt.close(fig)
     
     if show:
         plt.show()
     
-    plt.close(fig)
\ No newline at end of file
+    plt.close(fig)
+    wait_saved_figures()